@@ -11,6 +11,7 @@ from django import forms
 
 from kurantooro.models.Models import Report, Category, Problem, KuranUser
 from kurantooro.models.Period import Period
+from kurantooro.taxonomy import get_taxonomy
 
 
 class UserModificationForm(forms.ModelForm):
@@ -59,9 +60,24 @@ class CustomCategory(admin.ModelAdmin):
     list_display = ("slug", "name")
 
 
+class CategoryFilter(admin.SimpleListFilter):
+    title = "catégorie"
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return [(category.slug, category.name)
+                for category in get_taxonomy().categories.values()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category=self.value())
+        return queryset
+
+
 class CustomProblem(admin.ModelAdmin):
     list_display = ("slug", "name", "category")
-    list_filter = ("category",)
+    list_filter = (CategoryFilter,)
+    list_select_related = True
 
 
 admin.site.register(Report, CustomReport)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Columnar, memory-mapped snapshot of the Report x Problem facts.
+
+One row per (report, problem), stored as one raw binary file per column
+in settings.ANALYTICS_SNAPSHOT_DIR:
+
+ * report, period, user: ids (user is -1 for anonymous reports)
+ * problem, category: codes, indexes in meta.json's problems/categories
+ * day: days since 1970-01-01 of the report's created_on
+
+meta.json holds the number of rows and the last report id included.
+refresh() only appends the reports created since, hot or archived ;
+rows written after the last meta.json (interrupted refresh) are ignored
+and overwritten. It stops before the first report changed within the
+last settings.ANALYTICS_SNAPSHOT_LAG seconds: reports committed out of
+id order, or whose problems are linked after the report row, are read
+once settled. Later changes to existing reports need a rebuild.
+
+    snapshot = Snapshot.open()
+    snapshot.count_by('category', 'problem') '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import os
+from datetime import timedelta
+from itertools import chain
+
+import numpy
+from django.conf import settings
+from django.utils import timezone
+
+from kurantooro import archive, bucketing, calendar_engine
+from kurantooro.models.Change import Change
+
+COLUMNS = (('report', 'int64'), ('period', 'int64'), ('user', 'int64'),
+           ('problem', 'int32'), ('category', 'int32'), ('day', 'int32'))
+CHUNK_SIZE = 10000
+NO_USER = -1
+
+
+def snapshot_dir():
+    return getattr(settings, 'ANALYTICS_SNAPSHOT_DIR',
+                   os.path.join(settings.ROOT_DIR, 'snapshot'))
+
+
+def column_path(path, name):
+    return os.path.join(path, '{}.bin'.format(name))
+
+
+def empty_meta():
+    return {'size': 0, 'last_report_id': 0, 'problems': [], 'categories': [],
+            'columns': [list(column) for column in COLUMNS]}
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except IOError:
+        return empty_meta()
+
+
+def write_meta(path, meta):
+    meta_path = os.path.join(path, 'meta.json')
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.rename(meta_path + '.tmp', meta_path)
+
+
+def settled_before(after_id, lag):
+    ''' lowest id above after_id of a report changed within the last lag
+        seconds (its transaction may hide lower ids, its links may be
+        incomplete), or None when every report is settled '''
+    recent = [int(object_id) for object_id in Change.objects.filter(
+        model=Change.REPORT,
+        created_on__gt=timezone.now() - timedelta(seconds=lag))
+        .values_list('object_id', flat=True)]
+    recent = [report_id for report_id in recent if report_id > after_id]
+    return min(recent) if recent else None
+
+
+def report_facts(after_id, chunk_size, before_id=None):
+    ''' [(report, period, user, problem slug, category slug, created_on)]
+        of the next chunk_size reports (hot or archived) after after_id
+        and below before_id, and their last id '''
+    querysets = archive.report_querysets()
+    candidates = []
+    for queryset in querysets:
+        queryset = queryset.filter(id__gt=after_id)
+        if before_id is not None:
+            queryset = queryset.filter(id__lt=before_id)
+        candidates.append(queryset.order_by('id')
+                                  .values_list('id', flat=True)[:chunk_size])
+    ids = sorted(chain.from_iterable(candidates))[:chunk_size]
+    if not ids:
+        return [], after_id
+    facts = []
+    for queryset in querysets:
+        facts.extend(queryset.model.problems.through.objects
+                     .filter(report__gt=after_id, report__lte=ids[-1])
+                     .values_list('report', 'report__period',
+                                  'report__kuran_user', 'problem',
+                                  'problem__category', 'report__created_on'))
+    facts.sort(key=lambda fact: (fact[0], fact[3]))
+    return facts, ids[-1]
+
+
+def encode(facts, meta):
+    ''' {column: numpy array} of facts, new codes added to meta '''
+    codes = {}
+    for name in ('problems', 'categories'):
+        codes[name] = dict((slug, code)
+                           for code, slug in enumerate(meta[name]))
+
+    def code_of(name, slug):
+        if slug not in codes[name]:
+            codes[name][slug] = len(meta[name])
+            meta[name].append(slug)
+        return codes[name][slug]
+
+    rows = [(report_id, period_id,
+             NO_USER if user_id is None else user_id,
+             code_of('problems', problem), code_of('categories', category),
+             calendar_engine.epoch_seconds(created_on) // 86400)
+            for report_id, period_id, user_id, problem, category, created_on
+            in facts]
+    return dict((name, numpy.array([row[index] for row in rows],
+                                   dtype=dtype))
+                for index, (name, dtype) in enumerate(COLUMNS))
+
+
+def refresh(path=None, chunk_size=CHUNK_SIZE, rebuild=False, lag=None):
+    ''' appends the reports created since the last refresh.
+        Generator of the number of rows added per chunk. '''
+    path = path or snapshot_dir()
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    if rebuild:
+        # an interrupted rebuild must not leave the old size in meta.json
+        meta = empty_meta()
+        write_meta(path, meta)
+    else:
+        meta = read_meta(path)
+    if lag is None:
+        lag = getattr(settings, 'ANALYTICS_SNAPSHOT_LAG', 60)
+    before_id = settled_before(meta['last_report_id'], lag)
+
+    # drop what an interrupted refresh wrote after meta.json
+    for name, dtype in COLUMNS:
+        with open(column_path(path, name), 'ab') as f:
+            f.truncate(meta['size'] * numpy.dtype(dtype).itemsize)
+
+    while True:
+        facts, last_id = report_facts(meta['last_report_id'], chunk_size,
+                                      before_id)
+        if last_id == meta['last_report_id']:
+            break
+        columns = encode(facts, meta)
+        for name, dtype in COLUMNS:
+            with open(column_path(path, name), 'ab') as f:
+                columns[name].tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+        meta['size'] += len(facts)
+        meta['last_report_id'] = last_id
+        write_meta(path, meta)
+        yield len(facts)
+
+
+class Snapshot(object):
+    ''' read-only, memory-mapped snapshot '''
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.size = meta['size']
+        self.problems = meta['problems']
+        self.categories = meta['categories']
+        self.columns = {}
+
+    @classmethod
+    def open(cls, path=None):
+        path = path or snapshot_dir()
+        return cls(path, read_meta(path))
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name):
+        ''' numpy array of column `name`, mapped on first access '''
+        if name not in self.columns:
+            dtype = dict(COLUMNS)[name]
+            if not self.size:
+                self.columns[name] = numpy.zeros(0, dtype=dtype)
+            else:
+                self.columns[name] = numpy.memmap(
+                    column_path(self.path, name), dtype=dtype, mode='r',
+                    shape=(self.size,))
+        return self.columns[name]
+
+    def period_keys(self, period_type):
+        ''' calendar_engine index of the period_type period of each row '''
+        days = numpy.asarray(self.column('day')).astype('datetime64[D]')
+        return bucketing.bucket_keys(days, (period_type,))[period_type]
+
+    def mask(self, problems=None, categories=None, periods=None,
+             first_day=None, last_day=None):
+        ''' boolean array selecting the rows matching every criteria:
+            problem and category slugs, report period ids and
+            first_day/last_day dates '''
+        mask = numpy.ones(self.size, dtype=bool)
+        for name, codes in (('problem', problems), ('category', categories)):
+            if codes is not None:
+                values = self.problems if name == 'problem' \
+                    else self.categories
+                codes = [values.index(slug) for slug in codes
+                         if slug in values]
+                mask &= numpy.isin(self.column(name), codes)
+        if periods is not None:
+            mask &= numpy.isin(self.column('period'), list(periods))
+        for day, compare in ((first_day, numpy.greater_equal),
+                             (last_day, numpy.less_equal)):
+            if day is not None:
+                mask &= compare(self.column('day'),
+                                calendar_engine.ordinal_of(day)
+                                - bucketing.EPOCH_ORDINAL)
+        return mask
+
+    def decode(self, name, value):
+        if name == 'problem':
+            return self.problems[value]
+        if name == 'category':
+            return self.categories[value]
+        if name == 'user' and value == NO_USER:
+            return None
+        return value
+
+    def count_by(self, *keys, **kwargs):
+        ''' {key values: number of rows} grouped by keys, each a column name
+            or an array aligned with the rows. mask= restricts the rows.
+
+            snapshot.count_by('category', snapshot.period_keys(MONTH)) '''
+        mask = kwargs.get('mask')
+        names = [None if isinstance(key, (numpy.ndarray, list)) else key
+                 for key in keys]
+        arrays = [self.column(name) if name else numpy.asarray(key)
+                  for name, key in zip(names, keys)]
+        if mask is not None:
+            arrays = [array[mask] for array in arrays]
+        if not arrays or not len(arrays[0]):
+            return {}
+        stacked = numpy.stack([array.astype(numpy.int64)
+                               for array in arrays], axis=1)
+        groups, counts = numpy.unique(stacked, axis=0, return_counts=True)
+        result = {}
+        for group, count in zip(groups.tolist(), counts.tolist()):
+            result[tuple(self.decode(name, value) if name else value
+                         for name, value in zip(names, group))] = count
+        return result
+
+    def problem_frequencies(self, mask=None):
+        ''' {category slug: [(problem slug, count)] most frequent first} '''
+        frequencies = {}
+        for (category, problem), count in self.count_by(
+                'category', 'problem', mask=mask).items():
+            frequencies.setdefault(category, []).append((problem, count))
+        for problems in frequencies.values():
+            problems.sort(key=lambda item: (-item[1], item[0]))
+        return frequencies
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Read-only JSON API with cursor-based pagination.
+
+Every listing answers {"results": [...], "next": <cursor or null>}.
+Pass `next` back as ?cursor= to get the following page: pages are read
+with keyset conditions, never with OFFSET nor COUNT(*). '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import base64
+import bisect
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import six, timezone
+from django.utils.dateparse import parse_datetime, parse_date
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+
+from kurantooro import archive, calendar_engine
+from kurantooro.autocomplete import suggestions
+from kurantooro.exports import (report_pages, report_as_dict, filter_reports,
+                                attach_problems, attach_labels)
+from kurantooro.models.Change import Change
+from kurantooro.models.Models import KuranUser
+from kurantooro.models.Period import Period
+from kurantooro.taxonomy import get_taxonomy
+from kurantooro.versions import (conditional, user, last_change,
+                                 last_period, taxonomy_version)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def json_response(data, status=200):
+    return HttpResponse(json.dumps(data), status=status,
+                        content_type='application/json')
+
+
+def api_view(view):
+    ''' GET only, authenticated, BadRequest turned into a 400 '''
+    @require_GET
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated():
+            return json_response({'error': "Authentication required"}, 403)
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return json_response({'error': "{}".format(e)}, 400)
+    return wrapper
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(
+        json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(request, *types):
+    ''' list of values from ?cursor= or None ; one value of each of types
+        expected (bool is not accepted as an integer) '''
+    cursor = request.GET.get('cursor')
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+            cursor.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types) \
+            or not all(isinstance(value, kind)
+                       and not isinstance(value, bool)
+                       for value, kind in zip(values, types)):
+        raise BadRequest("Invalid cursor")
+    return values
+
+
+def get_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("Invalid limit")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def get_datetime(request, name):
+    ''' datetime from an ISO date or datetime parameter, or None '''
+    value = request.GET.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise BadRequest("Invalid {}".format(name))
+        parsed = parse_datetime("{}T00:00:00".format(day.isoformat()))
+    return parsed
+
+
+def period_as_dict(period, name):
+    return {'id': period.pk,
+            'key': period.key,
+            'period_type': period.period_type,
+            'start_on': period.start_on.isoformat(),
+            'end_on': period.end_on.isoformat(),
+            'name': name}
+
+
+def category_as_dict(category):
+    return {'slug': category.slug, 'name': category.name}
+
+
+def problem_as_dict(problem):
+    return {'slug': problem.slug, 'name': problem.name,
+            'category': category_as_dict(problem.category)}
+
+
+def by_slug(objects, request, serialize):
+    ''' page of taxonomy objects (served from the taxonomy cache) '''
+    limit = get_limit(request)
+    cursor = decode_cursor(request, six.string_types)
+    objects = sorted(objects, key=lambda obj: obj.slug)
+    start = 0
+    if cursor:
+        start = bisect.bisect_right([obj.slug for obj in objects], cursor[0])
+    page = objects[start:start + limit]
+    return json_response({
+        'results': [serialize(obj) for obj in page],
+        'next': encode_cursor([page[-1].slug])
+        if len(page) == limit else None})
+
+
+@api_view
+@conditional(user, last_change, last_modified=None)
+def reports(request):
+    ''' ?period_type=, ?period_start=, ?period_end=, ?user=, ?category=
+        (archived reports included) '''
+    start = get_datetime(request, 'period_start')
+    end = get_datetime(request, 'period_end')
+
+    def filtered(queryset):
+        if request.GET.get('period_type'):
+            queryset = queryset.filter(
+                period__period_type=request.GET['period_type'])
+        if start is not None:
+            queryset = queryset.filter(period__start_on__gte=start)
+        if end is not None:
+            queryset = queryset.filter(period__end_on__lte=end)
+        if request.GET.get('user'):
+            queryset = queryset.filter(
+                kuran_user__username=request.GET['user'])
+        return filter_reports(queryset,
+                              category=request.GET.get('category') or None)
+    querysets = [filtered(queryset)
+                 for queryset in archive.report_querysets(start, end)]
+
+    after = decode_cursor(request, six.string_types, six.integer_types)
+    if after:
+        created_on = parse_datetime(after[0])
+        if created_on is None:
+            raise BadRequest("Invalid cursor")
+        after = (created_on, after[1])
+
+    limit = get_limit(request)
+    page = next(iter(report_pages(querysets, limit, after=after)), [])
+    return json_response({
+        'results': [report_as_dict(report) for report in page],
+        'next': encode_cursor([page[-1].created_on.isoformat(), page[-1].pk])
+        if len(page) == limit else None})
+
+
+@api_view
+@conditional(last_period, last_modified=None)
+def periods(request):
+    ''' ordered by (start_on, type, from the finest) ;
+        ?period_type=, ?start=, ?end= '''
+    queryset = Period.objects.order_by('key', 'id')
+    if request.GET.get('period_type'):
+        queryset = queryset.filter(period_type=request.GET['period_type'])
+    start = get_datetime(request, 'start')
+    if start is not None:
+        queryset = queryset.filter(
+            key__gte=calendar_engine.epoch_seconds(start)
+            * calendar_engine.KEY_FACTOR)
+    end = get_datetime(request, 'end')
+    if end is not None:
+        queryset = queryset.filter(end_on__lte=end)
+
+    cursor = decode_cursor(request, six.integer_types, six.integer_types)
+    if cursor:
+        key, period_id = cursor
+        queryset = queryset.filter(Q(key__gt=key)
+                                   | Q(key=key, id__gt=period_id))
+
+    limit = get_limit(request)
+    page = list(queryset[:limit])
+    return json_response({
+        'results': [period_as_dict(period, name) for period, name
+                    in zip(page, Period.labels(page))],
+        'next': encode_cursor([page[-1].key, page[-1].pk])
+        if len(page) == limit else None})
+
+
+@api_view
+@conditional(taxonomy_version, last_modified=None)
+def problems(request):
+    ''' ?category= '''
+    taxonomy = get_taxonomy()
+    if request.GET.get('category'):
+        problems = taxonomy.problems_for(request.GET['category'])
+    else:
+        problems = taxonomy.problems.values()
+    return by_slug(problems, request, problem_as_dict)
+
+
+@api_view
+@conditional(taxonomy_version, last_modified=None)
+def categories(request):
+    return by_slug(get_taxonomy().categories.values(), request,
+                   category_as_dict)
+
+
+def changed_objects(changes):
+    ''' {(model, object_id): serialized object} for upserted objects '''
+    ids = {}
+    for change in changes:
+        if change.action == Change.UPSERT:
+            ids.setdefault(change.model, []).append(change.object_id)
+
+    data = {}
+    taxonomy = get_taxonomy()
+    for slug in ids.get(Change.CATEGORY, []):
+        if taxonomy.category(slug) is not None:
+            data[(Change.CATEGORY, slug)] = \
+                category_as_dict(taxonomy.category(slug))
+    for slug in ids.get(Change.PROBLEM, []):
+        if taxonomy.problem(slug) is not None:
+            data[(Change.PROBLEM, slug)] = \
+                problem_as_dict(taxonomy.problem(slug))
+    report_ids = set(int(report_id)
+                     for report_id in ids.get(Change.REPORT, []))
+    reports = []
+    # archived reports are still synced: look for them in the archives
+    for queryset in archive.report_querysets() if report_ids else []:
+        found = list(queryset.select_related('kuran_user', 'period')
+                             .filter(id__in=list(report_ids)))
+        report_ids.difference_update(report.pk for report in found)
+        reports.extend(found)
+        if not report_ids:
+            break
+    attach_problems(reports)
+    attach_labels(reports)
+    for report in reports:
+        data[(Change.REPORT, "{}".format(report.pk))] = report_as_dict(report)
+    return data
+
+
+def kuran_user_id(request):
+    ''' id of the KuranUser of the logged in user, None if there is none.
+        Logins are auth.User rows, not KuranUser ones: both tables have
+        their own ids and are matched by username. '''
+    try:
+        return KuranUser.objects.values_list('pk', flat=True) \
+                                .get(username=request.user.username)
+    except KuranUser.DoesNotExist:
+        return None
+
+
+@gzip_page
+@api_view
+def sync(request):
+    ''' taxonomy and own reports changed since ?since=<sequence>
+
+    Deleted objects, and reports moved to another user, come as
+    tombstones (action "delete", no data). Call again with the returned
+    cursor while "more" is true.
+
+    Changes younger than settings.SYNC_LAG seconds are held back: a
+    transaction still running may commit a lower sequence later. '''
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        raise BadRequest("Invalid since")
+    limit = get_limit(request)
+
+    lag = timedelta(seconds=getattr(settings, 'SYNC_LAG', 60))
+    synced = Q(model__in=(Change.CATEGORY, Change.PROBLEM))
+    owner = kuran_user_id(request)
+    if owner is not None:
+        synced |= Q(model=Change.REPORT, owner=owner)
+    changes = list(Change.objects.filter(id__gt=since,
+                                         created_on__lte=timezone.now() - lag)
+                         .filter(synced)
+                         .order_by('id')[:limit])
+    data = changed_objects(changes)
+
+    entries = []
+    for change in changes:
+        obj = data.get((change.model, change.object_id))
+        entries.append({'seq': change.id,
+                        'model': change.model,
+                        'id': change.object_id,
+                        # deleted since the change was recorded
+                        'action': change.action if obj else Change.DELETE,
+                        'data': obj})
+    return json_response({
+        'cursor': changes[-1].id if changes else since,
+        'more': len(changes) == limit,
+        'changes': entries})
+
+
+@api_view
+def autocomplete(request):
+    ''' problems matching ?query=, in the jquery.autocomplete format '''
+    query = request.GET.get('query', '')
+    return json_response({'query': query,
+                          'suggestions': suggestions(query)})
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Per-year archive tables for historical reports.
+
+archive_year() moves the reports attached to the periods of a year (and
+their problem links) into kurantooro_report_<year> and
+kurantooro_report_problems_<year>, created with the columns of the report
+and link tables ; restore_year() moves them back. Both work by chunks of ids, one
+transaction each, and resume where an interrupted run stopped.
+
+Rollups are left untouched: archived reports still count.
+
+Archived reports stay readable: report_model() is an unmanaged Report
+model on an archive's tables (its problems read the archived links) and
+report_querysets() lists the Report queryset then the querysets of the
+archives overlapping a date range, for exports, the API and sync.
+reports_in() and count_in() read a period's reports the same way. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from collections import Counter
+
+from django.db import connection, models, transaction
+from django.db.models import F
+
+from kurantooro import calendar_engine
+from kurantooro.models.Archive import ReportArchive
+from kurantooro.models.Models import Report, Problem, KuranUser
+from kurantooro.models.Period import Period
+
+CHUNK_SIZE = 500
+# ids of a chunk are bound as parameters: SQLite allows 999
+MAX_CHUNK_SIZE = 999
+
+_report_models = {}
+
+
+def qn(name):
+    return connection.ops.quote_name(name)
+
+
+def columns(model):
+    return ", ".join(qn(field.column) for field in model._meta.local_fields)
+
+
+def key_range(period):
+    ''' (first, last) Period.key of the periods starting within period '''
+    return (calendar_engine.epoch_seconds(period.start_on)
+            * calendar_engine.KEY_FACTOR,
+            calendar_engine.epoch_seconds(period.end_on)
+            * calendar_engine.KEY_FACTOR + calendar_engine.KEY_FACTOR - 1)
+
+
+def execute(sql, params=None):
+    cursor = connection.cursor()
+    cursor.execute(sql, params or [])
+    return cursor
+
+
+def column_definitions(model):
+    ''' column definitions of model's table, as syncdb would create them
+        (the primary key of an archive is a plain integer) '''
+    definitions = []
+    for field in model._meta.local_fields:
+        column_type = models.IntegerField().db_type(connection) \
+            if isinstance(field, models.AutoField) \
+            else field.db_type(connection)
+        definition = "{} {}".format(qn(field.column), column_type)
+        if field.primary_key:
+            definition += " PRIMARY KEY"
+        elif not field.null:
+            definition += " NOT NULL"
+        definitions.append(definition)
+    return ", ".join(definitions)
+
+
+def create_tables(archive):
+    ''' empty tables with the columns (types included) of the report and
+        link tables '''
+    through = Report.problems.through
+    for table, model in ((archive.report_table, Report),
+                         (archive.link_table, through)):
+        execute("CREATE TABLE {table} ({columns})".format(
+            table=qn(table), columns=column_definitions(model)))
+    execute("CREATE INDEX {index} ON {table} ({column})".format(
+        index=qn("{}_period".format(archive.report_table)),
+        table=qn(archive.report_table), column=qn('period_id')))
+    execute("CREATE INDEX {index} ON {table} ({column})".format(
+        index=qn("{}_report".format(archive.link_table)),
+        table=qn(archive.link_table), column=qn('report_id')))
+    transaction.commit_unless_managed()
+
+
+def drop_tables(archive):
+    for table in (archive.link_table, archive.report_table):
+        execute("DROP TABLE {}".format(qn(table)))
+    transaction.commit_unless_managed()
+
+
+def move(ids, reports, links, to_reports, to_links):
+    ''' moves the reports `ids` and their links between tables '''
+    through = Report.problems.through
+    placeholders = ", ".join(["%s"] * len(ids))
+    for source, target, model, column in (
+            (links, to_links, through, 'report_id'),
+            (reports, to_reports, Report, 'id')):
+        execute("INSERT INTO {target} ({columns}) SELECT {columns} "
+                "FROM {source} WHERE {column} IN ({ids})".format(
+                    target=qn(target), source=qn(source),
+                    columns=columns(model), column=qn(column),
+                    ids=placeholders), ids)
+    for source, column in ((links, 'report_id'), (reports, 'id')):
+        execute("DELETE FROM {source} WHERE {column} IN ({ids})".format(
+            source=qn(source), column=qn(column), ids=placeholders), ids)
+
+
+def get_archive(year):
+    ''' ReportArchive of year, created with its tables if needed '''
+    try:
+        return ReportArchive.objects.get(year=year)
+    except ReportArchive.DoesNotExist:
+        pass
+    spec = calendar_engine.PeriodSpec(calendar_engine.YEAR, year)
+    period = Period.find_create_specs([spec])[spec]
+    first_key, last_key = key_range(period)
+    archive = ReportArchive.objects.create(
+        year=year, period=period, first_key=first_key, last_key=last_key,
+        report_table='{}_{}'.format(Report._meta.db_table, year),
+        link_table='{}_{}'.format(Report.problems.through._meta.db_table,
+                                  year))
+    create_tables(archive)
+    return archive
+
+
+def archive_year(year, chunk_size=CHUNK_SIZE):
+    ''' moves the reports of the periods of year to its archive.
+        Generator of the number of reports moved per chunk. '''
+    chunk_size = min(chunk_size, MAX_CHUNK_SIZE)
+    archive = get_archive(year)
+    if archive.status == ReportArchive.RESTORING:
+        raise ValueError("Archive {} is being restored".format(year))
+    archive.status = ReportArchive.ARCHIVING
+    archive.save()
+
+    hot = Report.objects.filter(period__key__gte=archive.first_key,
+                                period__key__lte=archive.last_key) \
+                        .order_by('id').values_list('id', flat=True)
+    while True:
+        ids = list(hot[:chunk_size])
+        if not ids:
+            break
+        with transaction.commit_on_success():
+            move(ids, Report._meta.db_table,
+                 Report.problems.through._meta.db_table,
+                 archive.report_table, archive.link_table)
+            ReportArchive.objects.filter(pk=archive.pk) \
+                                 .update(nb_reports=F('nb_reports') + len(ids))
+        yield len(ids)
+
+    archive.status = ReportArchive.ARCHIVED
+    archive.save()
+
+
+def restore_year(year, chunk_size=CHUNK_SIZE):
+    ''' moves the archived reports of year back to the Report table and
+        drops the archive. Generator of the number of reports moved. '''
+    chunk_size = min(chunk_size, MAX_CHUNK_SIZE)
+    archive = ReportArchive.objects.get(year=year)
+    archive.status = ReportArchive.RESTORING
+    archive.save()
+
+    while True:
+        ids = [row[0] for row in execute(
+            "SELECT {id} FROM {table} ORDER BY {id}".format(
+                id=qn('id'), table=qn(archive.report_table)))
+            .fetchmany(chunk_size)]
+        if not ids:
+            break
+        with transaction.commit_on_success():
+            move(ids, archive.report_table, archive.link_table,
+                 Report._meta.db_table,
+                 Report.problems.through._meta.db_table)
+            ReportArchive.objects.filter(pk=archive.pk) \
+                                 .update(nb_reports=F('nb_reports') - len(ids))
+        yield len(ids)
+
+    drop_tables(archive)
+    archive.delete()
+
+
+class ArchivedProblems(object):
+    ''' Report.problems of the archived reports, read from their links.
+
+    Not a ManyToManyField: Problem's relations are cached once loaded, so
+    a many-to-many added by report_model() later can not be queried. '''
+
+    def __init__(self, through):
+        self.through = through
+
+    def __get__(self, report, model=None):
+        if report is None:
+            return self
+        return Problem.objects.filter(
+            pk__in=self.through.objects.filter(report=report)
+                                       .values('problem'))
+
+
+def report_model(archive):
+    ''' unmanaged model of the reports archived in archive '''
+    if archive.year in _report_models:
+        return _report_models[archive.year]
+
+    def meta(table, **options):
+        options.update(app_label='kurantooro', db_table=table,
+                       managed=False)
+        return type(str('Meta'), (object, ), options)
+
+    name = str('ArchivedReport{}'.format(archive.year))
+    model = type(name, (models.Model, ), {
+        '__module__': __name__,
+        'Meta': meta(archive.report_table,
+                     ordering=Report._meta.ordering),
+        'created_on': models.DateTimeField(),
+        'kuran_user': models.ForeignKey(KuranUser, null=True,
+                                        related_name='+'),
+        'period': models.ForeignKey(Period, related_name='+'),
+    })
+    model.problems = ArchivedProblems(type(
+        str('{}Problem'.format(name)), (models.Model, ), {
+            '__module__': __name__,
+            'Meta': meta(archive.link_table),
+            'report': models.ForeignKey(model, related_name='+'),
+            'problem': models.ForeignKey(Problem, related_name='+'),
+        }))
+    _report_models[archive.year] = model
+    return model
+
+
+def archives_between(start_on=None, end_on=None):
+    ''' archives of the years overlapping start_on..end_on, each bound
+        optional, most recent first '''
+    archives = ReportArchive.objects.all()
+    if end_on is not None:
+        archives = archives.filter(
+            first_key__lte=calendar_engine.epoch_seconds(end_on)
+            * calendar_engine.KEY_FACTOR + calendar_engine.KEY_FACTOR - 1)
+    if start_on is not None:
+        archives = archives.filter(
+            last_key__gte=calendar_engine.epoch_seconds(start_on)
+            * calendar_engine.KEY_FACTOR)
+    return archives
+
+
+def report_querysets(start_on=None, end_on=None):
+    ''' [Report queryset, then one per archive overlapping the range].
+        A report is in exactly one of them. '''
+    return [Report.objects.all()] + \
+        [report_model(archive).objects.all()
+         for archive in archives_between(start_on, end_on)]
+
+
+def reports_in(period):
+    ''' reports attached to periods within period: the hot ones, then
+        the ones of each overlapping archive, in no particular order '''
+    first_key, last_key = key_range(period)
+    for queryset in report_querysets(period.start_on, period.end_on):
+        for report in queryset.filter(period__key__gte=first_key,
+                                      period__key__lte=last_key) \
+                              .order_by().iterator():
+            yield report
+
+
+def count_in(period):
+    ''' number of reports attached to periods within period '''
+    first_key, last_key = key_range(period)
+    return sum(queryset.filter(period__key__gte=first_key,
+                               period__key__lte=last_key).count()
+               for queryset in report_querysets(period.start_on,
+                                                period.end_on))
+
+
+def count_archived():
+    ''' rollup Counter (see rollups) of all archived reports '''
+    counts = Counter()
+    for archive in ReportArchive.objects.all():
+        cursor = execute(
+            "SELECT r.{period}, l.{problem}, p.{category}, r.{user}, COUNT(*) "
+            "FROM {reports} r INNER JOIN {links} l ON l.{report} = r.{id} "
+            "INNER JOIN {problems} p ON p.{slug} = l.{problem} "
+            "GROUP BY r.{period}, l.{problem}, p.{category}, r.{user}".format(
+                period=qn('period_id'), problem=qn('problem_id'),
+                category=qn('category_id'), user=qn('kuran_user_id'),
+                report=qn('report_id'), id=qn('id'), slug=qn('slug'),
+                reports=qn(archive.report_table),
+                links=qn(archive.link_table),
+                problems=qn(Problem._meta.db_table)))
+        for period_id, problem_id, category_id, user_id, count in cursor:
+            counts[(period_id, problem_id, category_id, user_id)] += count
+    return counts
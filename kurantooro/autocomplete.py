@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' In-memory, accent-insensitive index for problem autocompletion.
+
+Each problem is indexed on the words of its name and of its category's
+name: word prefixes answer "starts with" queries, trigrams answer
+"contains" ones. The index is rebuilt only when the taxonomy version
+changes. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import re
+import threading
+import unicodedata
+
+from kurantooro.taxonomy import get_taxonomy
+
+MAX_PREFIX = 12
+NB_SUGGESTIONS = 10
+
+_lock = threading.Lock()
+_index = {'version': None, 'index': None}
+
+
+def normalize(text):
+    ''' lower case, accents stripped, words separated by single spaces '''
+    text = unicodedata.normalize('NFKD', "{}".format(text).lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.split(r'\W+', text, flags=re.UNICODE)).strip()
+
+
+def trigrams(word):
+    return set(word[index:index + 3] for index in range(len(word) - 2))
+
+
+class PrefixIndex(object):
+    ''' word prefix and trigram index over (text, entry) pairs '''
+
+    def __init__(self, items):
+        self.entries = []
+        self.texts = []
+        self.prefixes = {}
+        self.trigrams = {}
+        for number, (text, entry) in enumerate(items):
+            text = normalize(text)
+            self.entries.append(entry)
+            self.texts.append(text)
+            for word in text.split():
+                for length in range(1, min(len(word), MAX_PREFIX) + 1):
+                    self.prefixes.setdefault(word[:length], set()).add(number)
+                for trigram in trigrams(word):
+                    self.trigrams.setdefault(trigram, set()).add(number)
+
+    def match_word(self, word):
+        ''' numbers of the entries with a word starting with or,
+            for 3+ characters, containing `word` '''
+        matches = set(number for number
+                      in self.prefixes.get(word[:MAX_PREFIX], ())
+                      if len(word) <= MAX_PREFIX
+                      or any(text_word.startswith(word)
+                             for text_word in self.texts[number].split()))
+        if len(word) >= 3:
+            candidates = None
+            for trigram in trigrams(word):
+                found = self.trigrams.get(trigram, set())
+                candidates = found if candidates is None \
+                    else candidates & found
+            matches.update(number for number in candidates or ()
+                           if word in self.texts[number])
+        return matches
+
+    def search(self, query, limit=NB_SUGGESTIONS):
+        words = normalize(query).split()
+        if not words:
+            return []
+        numbers = None
+        for word in words:
+            found = self.match_word(word)
+            numbers = found if numbers is None else numbers & found
+            if not numbers:
+                return []
+        # entries starting with the query first, then alphabetical
+        query = " ".join(words)
+        ranked = sorted(numbers, key=lambda number: (
+            not self.texts[number].startswith(query), self.texts[number]))
+        return [self.entries[number] for number in ranked[:limit]]
+
+
+def build_index(taxonomy):
+    ''' PrefixIndex of the problems, searchable by category name as well '''
+    return PrefixIndex(
+        ("{} {}".format(problem.name, problem.category.name),
+         {'value': problem.name,
+          'data': {'slug': problem.slug,
+                   'category': problem.category.name}})
+        for problem in taxonomy.problems.values())
+
+
+def get_index():
+    taxonomy = get_taxonomy()
+    if _index['version'] != taxonomy.version:
+        with _lock:
+            if _index['version'] != taxonomy.version:
+                _index['index'] = build_index(taxonomy)
+                _index['version'] = taxonomy.version
+    return _index['index']
+
+
+def suggestions(query, limit=NB_SUGGESTIONS):
+    ''' jquery.autocomplete suggestions for query '''
+    return get_index().search(query, limit)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Benchmark scenarios run on a throw-away database seeded with
+synthetic data at growing scales.
+
+Each scenario returns result dicts (name, type, scale, count, ops_per_s,
+mean and percentiles in microseconds) ; compare() matches two runs and
+lists the results slower than a threshold. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from kurantooro import calendar_engine, dashboard
+from kurantooro.ingest import ingest, CHUNK_SIZE
+from kurantooro.models.Models import Category, Problem, KuranUser
+from kurantooro.models.Period import (Period, DayPeriod, WeekPeriod,
+                                      MonthPeriod, YearPeriod,
+                                      PERIOD_CLASSES, period_cache)
+from kurantooro.utils import chunked, bulk_insert_ignore
+
+EPOCH = datetime(1970, 1, 1, 0, 0, tzinfo=timezone.utc)
+REPORTS_RATIO = 10
+NB_PROBLEMS = 20
+SUB_CLASSES = (DayPeriod, WeekPeriod, MonthPeriod)
+CHAIN_CLASSES = (DayPeriod, WeekPeriod, MonthPeriod, YearPeriod)
+METRICS = ('mean_us', 'p50_us', 'p95_us', 'p99_us')
+
+
+class TestDatabase(object):
+    ''' context manager running the enclosed block on a throw-away
+        test database (in-memory with SQLite) '''
+
+    def __enter__(self):
+        self.old_name = connection.creation.create_test_db(verbosity=0,
+                                                           autoclobber=True)
+        return self
+
+    def __exit__(self, *args):
+        connection.creation.destroy_test_db(self.old_name, verbosity=0)
+
+
+def summarize(timings, units=None):
+    ''' count, throughput, mean and percentiles (in microseconds) of a
+        list of durations expressed in seconds.
+
+    units: number of items processed, when calls handle several '''
+    timings = sorted(timings)
+    count = len(timings)
+    total = sum(timings)
+
+    def percentile(p):
+        if not count:
+            return 0.0
+        return timings[min(count - 1, int(count * p / 100))] * 1000000
+
+    return {
+        'count': count,
+        'ops_per_s': ((units or count) / total) if total else 0.0,
+        'mean_us': (total / count * 1000000) if count else 0.0,
+        'p50_us': percentile(50),
+        'p95_us': percentile(95),
+        'p99_us': percentile(99),
+    }
+
+
+def time_calls(func, arguments):
+    ''' list of durations of func(arg) for each arg '''
+    timings = []
+    for arg in arguments:
+        start = time.time()
+        func(arg)
+        timings.append(time.time() - start)
+    return timings
+
+
+def result(name, scale, timings, period_type=None, units=None, **extra):
+    data = summarize(timings, units)
+    data.update({'name': name, 'type': period_type, 'scale': scale})
+    data.update(extra)
+    return data
+
+
+def seed_day_periods(start_index, count):
+    ''' inserts `count` consecutive DayPeriod from EPOCH + start_index days,
+        skipping the ones created by the scenarios of a previous scale '''
+    rows = []
+    for index in range(start_index, start_index + count):
+        start_on, end_on = DayPeriod.boundaries(EPOCH + timedelta(index))
+        rows.append((start_on, end_on, Period.DAY,
+                     calendar_engine.period_key(Period.DAY, start_on)))
+    bulk_insert_ignore(Period, ('start_on', 'end_on', 'period_type', 'key'),
+                       rows)
+
+
+def random_dates(scale, count):
+    ''' dates within the `scale` seeded days '''
+    return [EPOCH + timedelta(random.randint(0, scale - 1),
+                              random.randint(0, 86399))
+            for _ in range(count)]
+
+
+def bench_period_lookup(scale, lookups=1000):
+    ''' find_create_by_date() of each period type, cold cache '''
+    results = []
+    for period_type, cls in sorted(PERIOD_CLASSES.items()):
+        period_cache.clear()
+        results.append(result(
+            'find_create_by_date', scale,
+            time_calls(cls.find_create_by_date, random_dates(scale, lookups)),
+            period_type))
+    return results
+
+
+def bench_list_of_subs(scale, lookups=1000):
+    ''' days, weeks and months of a year '''
+    years = [YearPeriod.find_create_by_date(date_obj)
+             for date_obj in random_dates(scale, max(1, lookups // 100))]
+    results = []
+    for cls in SUB_CLASSES:
+        period_cache.clear()
+        results.append(result(
+            'list_of_subs', scale,
+            time_calls(lambda year: year.list_of_subs(cls), years),
+            cls.type()))
+    return results
+
+
+def bench_chains(scale, lookups=1000):
+    ''' following() then previous() chains of `lookups` periods '''
+    results = []
+    for cls in CHAIN_CLASSES:
+        for name in ('following', 'previous'):
+            period_cache.clear()
+            period = cls.find_create_by_date(random_dates(scale, 1)[0])
+            timings = []
+            for _ in range(lookups):
+                start = time.time()
+                period = getattr(period, name)()
+                timings.append(time.time() - start)
+            results.append(result(name, scale, timings, cls.type()))
+    return results
+
+
+def bench_names(scale, lookups=1000):
+    ''' name() and full_name() of each period type '''
+    results = []
+    for period_type, cls in sorted(PERIOD_CLASSES.items()):
+        periods = [cls.find_create_by_date(date_obj)
+                   for date_obj in random_dates(scale, lookups)]
+        for name in ('name', 'full_name'):
+            results.append(result(
+                name, scale,
+                time_calls(lambda period: getattr(period, name)(), periods),
+                period_type))
+    return results
+
+
+def seed_taxonomy():
+    ''' (username, [problem slugs]) of the synthetic reporters '''
+    user, created = KuranUser.objects.get_or_create(username='bench')
+    category, created = Category.objects.get_or_create(
+        slug='bench', defaults={'name': "Bench"})
+    slugs = []
+    for number in range(NB_PROBLEMS):
+        problem, created = Problem.objects.get_or_create(
+            slug='bench-{}'.format(number),
+            defaults={'name': "Bench {}".format(number),
+                      'category': category})
+        slugs.append(problem.slug)
+    return user.username, slugs
+
+
+def synthetic_reports(count, username, slugs, days=400):
+    ''' report records spread over the last `days` days '''
+    now = datetime.now()
+    for _ in range(count):
+        created_on = now - timedelta(random.randint(0, days - 1),
+                                     random.randint(0, 86399))
+        yield {'created_on': created_on.isoformat(),
+               'username': random.choice((username, None)),
+               'problems': random.sample(slugs, random.randint(1, 3))}
+
+
+def bench_ingest(scale, count):
+    ''' ingestion of `count` reports, timed per chunk '''
+    username, slugs = seed_taxonomy()
+    timings = []
+    for chunk in chunked(synthetic_reports(count, username, slugs),
+                         CHUNK_SIZE):
+        start = time.time()
+        ingest(chunk, CHUNK_SIZE)
+        timings.append(time.time() - start)
+    return [result('ingest', scale, timings, units=count,
+                   reports=count, chunk_size=CHUNK_SIZE)]
+
+
+def bench_dashboard(scale, lookups=1000):
+    ''' dashboard figures computed without the context cache '''
+    periods = dashboard.dashboard_periods()
+    timings = time_calls(dashboard.build_context,
+                         [periods] * max(1, lookups // 10))
+    return [result('dashboard', scale, timings)]
+
+
+def run(scales, lookups=1000):
+    ''' results of every scenario, the database growing with each scale:
+        `scale` DayPeriod rows and scale / REPORTS_RATIO reports '''
+    results = []
+    seeded = 0
+    for scale in sorted(scales):
+        seed_day_periods(seeded, scale - seeded)
+        reports = (scale - seeded) // REPORTS_RATIO
+        seeded = scale
+        results.extend(bench_period_lookup(scale, lookups))
+        results.extend(bench_list_of_subs(scale, lookups))
+        results.extend(bench_chains(scale, lookups))
+        results.extend(bench_names(scale, lookups))
+        if reports:
+            results.extend(bench_ingest(scale, reports))
+        results.extend(bench_dashboard(scale, lookups))
+    return results
+
+
+def result_key(data):
+    return (data['name'], data['type'], data['scale'])
+
+
+def compare(baseline, current, metric='p50_us', threshold=10):
+    ''' [(baseline result, current result, ratio)] of the results whose
+        `metric` grew by more than threshold percent '''
+    previous = dict((result_key(data), data) for data in baseline)
+    regressions = []
+    for data in current:
+        old = previous.get(result_key(data))
+        if not old or not old[metric]:
+            continue
+        ratio = data[metric] / old[metric]
+        if ratio > 1 + threshold / 100:
+            regressions.append((old, data, ratio))
+    return regressions
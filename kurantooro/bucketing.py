@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Vectorized assignment of timestamps to calendar periods.
+
+    keys = bucket_keys(timestamps, (DAY, MONTH))
+    days = resolve_periods(DAY, keys[DAY])
+    periods = [days[key] for key in keys[DAY]]
+
+Keys are the calendar_engine indexes of the periods. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from datetime import date
+
+import numpy
+from django.utils import timezone
+
+from kurantooro.calendar_engine import (PeriodSpec, PERIOD_TYPES,
+                                        DAY_BASED, MONTH_BASED)
+from kurantooro.models.Period import Period
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+EPOCH_MONTH = 1970 * 12
+
+
+def as_datetime64(timestamps):
+    ''' naive UTC datetime64[us] array from datetimes or a datetime64 array '''
+    if isinstance(timestamps, numpy.ndarray) and timestamps.dtype.kind == 'M':
+        return timestamps.astype('datetime64[us]')
+
+    def naive_utc(value):
+        if timezone.is_aware(value):
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    return numpy.array([naive_utc(value) for value in timestamps],
+                       dtype='datetime64[us]')
+
+
+def bucket_keys(timestamps, period_types=PERIOD_TYPES):
+    ''' {period_type: int64 array of period keys} in one pass per unit '''
+    stamps = as_datetime64(timestamps)
+    keys = {}
+
+    if any(period_type in DAY_BASED for period_type in period_types):
+        ordinals = stamps.astype('datetime64[D]').astype(numpy.int64) \
+            + EPOCH_ORDINAL
+    if any(period_type in MONTH_BASED for period_type in period_types):
+        months = stamps.astype('datetime64[M]').astype(numpy.int64) \
+            + EPOCH_MONTH
+
+    for period_type in period_types:
+        if period_type in DAY_BASED:
+            length, offset = DAY_BASED[period_type]
+            keys[period_type] = (ordinals - offset) // length
+        elif period_type in MONTH_BASED:
+            keys[period_type] = months // MONTH_BASED[period_type]
+        else:
+            raise ValueError("Unknown period type: {}".format(period_type))
+    return keys
+
+
+def resolve_periods(period_type, keys):
+    ''' {key: Period} for the distinct keys, created in bulk if missing '''
+    specs = [PeriodSpec(period_type, int(key)) for key in numpy.unique(keys)]
+    found = Period.find_create_specs(specs)
+    return dict((spec.index, period) for spec, period in found.items())
+
+
+def bucket_periods(timestamps, period_types=PERIOD_TYPES):
+    ''' {period_type: [Period, ...]} aligned with timestamps '''
+    periods = {}
+    for period_type, keys in bucket_keys(timestamps, period_types).items():
+        resolved = resolve_periods(period_type, keys)
+        periods[period_type] = [resolved[key] for key in keys.tolist()]
+    return periods
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Database-free calendar arithmetic for Periods.
+
+Each calendar period is identified by its type and an integer index:
+
+ * day: proleptic Gregorian ordinal of the day
+ * week: number of Monday-started weeks since 0001-01-01 (a Monday)
+ * month, quarter, semester, year: number of such periods since year 0
+
+Boundaries, next/previous and containment are plain integer operations
+on that index. Period models are only needed to persist a spec:
+
+    spec = spec_for(MONTH, datetime(2013, 10, 12))
+    start_on, end_on = spec.following().boundaries() '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from datetime import datetime, date, timedelta
+
+from django.utils import timezone
+
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+QUARTER = 'quarter'
+SEMESTER = 'semester'
+YEAR = 'year'
+CUSTOM = 'custom'
+
+# from the finest to the coarsest
+PERIOD_TYPES = (DAY, WEEK, MONTH, QUARTER, SEMESTER, YEAR)
+
+# types having a Period proxy, materialized ahead of time
+CALENDAR_TYPES = (DAY, WEEK, MONTH, QUARTER, YEAR)
+
+# day-based types: (length in days, ordinal of the first day of index 0)
+DAY_BASED = {DAY: (1, 0), WEEK: (7, 1)}
+
+# month-based types: length in months
+MONTH_BASED = {MONTH: 1, QUARTER: 3, SEMESTER: 6, YEAR: 12}
+
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# period keys: epoch seconds of start_on * KEY_FACTOR + type code, so that
+# keys sort by start then from the finest to the coarsest type
+KEY_FACTOR = 8
+TYPE_CODES = dict((period_type, code) for code, period_type
+                  in enumerate(PERIOD_TYPES + (CUSTOM,)))
+
+
+def ordinal_of(date_obj):
+    ''' proleptic ordinal of a date or a datetime (naive means UTC) '''
+    if isinstance(date_obj, datetime):
+        if timezone.is_aware(date_obj):
+            date_obj = date_obj.astimezone(timezone.utc)
+        return date_obj.toordinal()
+    if isinstance(date_obj, date):
+        return date_obj.toordinal()
+    raise TypeError("Can not understand date object.")
+
+
+def datetime_of(ordinal):
+    ''' aware UTC datetime at the start of the day `ordinal` '''
+    day = date.fromordinal(ordinal)
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def epoch_seconds(date_obj):
+    ''' whole seconds since 1970-01-01 UTC of a datetime (naive means UTC) '''
+    if timezone.is_naive(date_obj):
+        date_obj = date_obj.replace(tzinfo=timezone.utc)
+    delta = date_obj - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+def period_key(period_type, start):
+    ''' sortable integer key of the period of period_type starting at start '''
+    return epoch_seconds(start) * KEY_FACTOR + TYPE_CODES[period_type]
+
+
+def month_ordinal(month_index):
+    ''' ordinal of the first day of the month `month_index` (year * 12 + m-1) '''
+    return date(month_index // 12, month_index % 12 + 1, 1).toordinal()
+
+
+class PeriodSpec(object):
+    ''' Lightweight value object for a calendar period (type + index) '''
+
+    __slots__ = ('period_type', 'index')
+
+    def __init__(self, period_type, index):
+        if period_type not in DAY_BASED and period_type not in MONTH_BASED:
+            raise ValueError("Unknown period type: {}".format(period_type))
+        self.period_type = period_type
+        self.index = index
+
+    def __repr__(self):
+        return "PeriodSpec({!r}, {!r})".format(self.period_type, self.index)
+
+    def __eq__(self, other):
+        try:
+            return (self.period_type == other.period_type
+                    and self.index == other.index)
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self.period_type, self.index))
+
+    @property
+    def start_ordinal(self):
+        ''' ordinal of the first day of the period '''
+        if self.period_type in DAY_BASED:
+            length, offset = DAY_BASED[self.period_type]
+            return self.index * length + offset
+        return month_ordinal(self.index * MONTH_BASED[self.period_type])
+
+    @property
+    def end_ordinal(self):
+        ''' ordinal of the first day *after* the period '''
+        return self.following().start_ordinal
+
+    @property
+    def start(self):
+        return datetime_of(self.start_ordinal)
+
+    @property
+    def end(self):
+        ''' last microsecond of the period (as stored in Period.end_on) '''
+        return datetime_of(self.end_ordinal) - ONE_MICROSECOND
+
+    def boundaries(self):
+        return (self.start, self.end)
+
+    @property
+    def cache_key(self):
+        ''' same as Period.cache_key for the matching Period row '''
+        return (self.period_type, self.start, self.end)
+
+    @property
+    def key(self):
+        ''' same as Period.key for the matching Period row '''
+        return period_key(self.period_type, self.start)
+
+    def following(self):
+        return PeriodSpec(self.period_type, self.index + 1)
+
+    def previous(self):
+        return PeriodSpec(self.period_type, self.index - 1)
+
+    def includes(self, date_obj):
+        return (self.start_ordinal <= ordinal_of(date_obj)
+                < self.end_ordinal)
+
+    def subs(self, period_type):
+        ''' specs of `period_type` starting within this period
+
+        The first one is the one including the start of this period. '''
+        first = spec_for(period_type, date.fromordinal(self.start_ordinal))
+        last = spec_for(period_type, date.fromordinal(self.end_ordinal - 1))
+        return [PeriodSpec(period_type, index)
+                for index in range(first.index, last.index + 1)]
+
+
+def index_for(period_type, date_obj):
+    ''' index of the `period_type` period including date_obj '''
+    ordinal = ordinal_of(date_obj)
+    if period_type in DAY_BASED:
+        length, offset = DAY_BASED[period_type]
+        return (ordinal - offset) // length
+    if period_type in MONTH_BASED:
+        day = date.fromordinal(ordinal)
+        return (day.year * 12 + day.month - 1) // MONTH_BASED[period_type]
+    raise ValueError("Unknown period type: {}".format(period_type))
+
+
+def spec_for(period_type, date_obj):
+    ''' PeriodSpec of `period_type` including date_obj '''
+    return PeriodSpec(period_type, index_for(period_type, date_obj))
+
+
+def year_specs(first_year, last_year, period_type):
+    ''' specs of `period_type` covering the years first_year..last_year,
+        in order '''
+    first = spec_for(period_type, date(first_year, 1, 1))
+    last = spec_for(period_type, date(last_year, 12, 31))
+    return (PeriodSpec(period_type, index)
+            for index in range(first.index, last.index + 1))
+
+
+def boundaries(period_type, date_obj):
+    ''' (start, end) aware datetimes of the period including date_obj '''
+    return spec_for(period_type, date_obj).boundaries()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Dashboard figures, read from the ProblemCount rollups and cached.
+
+The figures are the same for every user. Cached contexts are keyed by
+the current week and month and by the DataVersion of the rollups,
+bumped in the database whenever ProblemCount changes. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from kurantooro import calendar_engine
+from kurantooro.models.Period import Period, MonthPeriod, WeekPeriod
+from kurantooro.models.Rollup import ProblemCount
+from kurantooro.models.Version import DataVersion
+
+NB_MONTHS = 12
+NB_TOP_PROBLEMS = 10
+CACHE_TIMEOUT = 60 * 60
+
+
+def dashboard_periods():
+    ''' current week, previous week and the last NB_MONTHS months '''
+    week = WeekPeriod.current()
+    month = MonthPeriod.current()
+    spec = month.spec()
+    months = Period.find_create_specs(
+        calendar_engine.PeriodSpec(spec.period_type, index)
+        for index in range(spec.index - NB_MONTHS + 1, spec.index + 1))
+    return {'week': week,
+            'previous_week': week.previous(),
+            'month': month,
+            'months': [months[key] for key in sorted(months,
+                                                     key=lambda s: s.index)]}
+
+
+def get_version():
+    return DataVersion.get(DataVersion.ROLLUPS)
+
+
+def invalidate():
+    ''' changes the version: every cached context becomes stale '''
+    DataVersion.bump(DataVersion.ROLLUPS)
+
+
+def problem_totals(period):
+    ''' [(problem_id, name, category_name, total)] of a period '''
+    return list(ProblemCount.objects.filter(period=period)
+                            .values_list('problem', 'problem__name',
+                                         'category__name')
+                            .annotate(total=Sum('count'))
+                            .order_by('-total'))
+
+
+def build_context(periods):
+    month_rows = problem_totals(periods['month'])
+
+    categories = OrderedDict()
+    for problem_id, name, category, total in month_rows:
+        categories[category] = categories.get(category, 0) + total
+
+    # per-category trends: a single query over the month periods
+    months = periods['months']
+    columns = dict((month.pk, index) for index, month in enumerate(months))
+    trends = OrderedDict()
+    rows = ProblemCount.objects.filter(period__in=list(columns)) \
+                               .values_list('category__name', 'period') \
+                               .annotate(total=Sum('count')) \
+                               .order_by('category__name')
+    for category, period_id, total in rows:
+        trends.setdefault(category, [0] * len(months))
+        trends[category][columns[period_id]] = total
+
+    # week over week deltas
+    this_week = dict((row[0], row) for row in
+                     problem_totals(periods['week']))
+    last_week = dict((row[0], row[3]) for row in
+                     problem_totals(periods['previous_week']))
+    deltas = []
+    for problem_id in set(this_week).union(last_week):
+        current = this_week[problem_id][3] if problem_id in this_week else 0
+        previous = last_week.get(problem_id, 0)
+        deltas.append({'problem': problem_id,
+                       'name': this_week[problem_id][1]
+                       if problem_id in this_week else problem_id,
+                       'current': current,
+                       'previous': previous,
+                       'delta': current - previous})
+    deltas.sort(key=lambda row: abs(row['delta']), reverse=True)
+
+    return {
+        'month_name': periods['month'].full_name(),
+        'week_name': periods['week'].full_name(),
+        'total': sum(categories.values()),
+        'categories': list(categories.items()),
+        'top_problems': [{'problem': row[0], 'name': row[1],
+                          'category': row[2], 'total': row[3]}
+                         for row in month_rows[:NB_TOP_PROBLEMS]],
+        'trend_months': Period.labels(months),
+        'trends': list(trends.items()),
+        'week_deltas': deltas[:NB_TOP_PROBLEMS],
+    }
+
+
+def get_context():
+    ''' dashboard figures, from cache when possible '''
+    periods = dashboard_periods()
+    key = 'dashboard:{week}:{month}:{version}'.format(
+        week=periods['week'].pk, month=periods['month'].pk,
+        version=get_version())
+    context = cache.get(key)
+    if context is None:
+        context = build_context(periods)
+        cache.set(key, context, CACHE_TIMEOUT)
+    return context
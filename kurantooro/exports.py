@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Constant-memory export of reports.
+
+Reports are read by keyset pagination on the model ordering
+(-created_on, -id) and their problems are fetched once per page
+(names and categories come from the taxonomy cache). Archived reports
+(see archive) are read from their tables and merged in the same order. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+from itertools import chain
+
+from django.db.models import Q
+
+from kurantooro import archive
+from kurantooro.models.Period import Period
+from kurantooro.taxonomy import get_taxonomy
+from kurantooro.utils import UnicodeWriter, chunked
+
+CHUNK_SIZE = 500
+CSV_FIELDS = ('id', 'created_on', 'username', 'user', 'period',
+              'period_type', 'problems', 'problem_names', 'categories')
+
+
+def filter_reports(reports, period=None, category=None):
+    ''' reports attached to a period within `period` and having a problem
+        of `category` (Period instance and Category slug) '''
+    if period is not None:
+        reports = reports.filter(period__start_on__gte=period.start_on,
+                                 period__end_on__lte=period.end_on)
+    if category is not None:
+        reports = reports.filter(id__in=reports.model.problems.through
+                                 .objects.filter(problem__category=category)
+                                 .values('report'))
+    return reports
+
+
+def keyset_pages(reports, chunk_size=CHUNK_SIZE, after=None):
+    ''' lists of at most chunk_size reports, ordered by (-created_on, -id)
+
+    after: (created_on, id) of the last report already read '''
+    reports = reports.select_related('kuran_user', 'period') \
+                     .order_by('-created_on', '-id')
+    while True:
+        page = reports
+        if after is not None:
+            created_on, report_id = after
+            page = page.filter(Q(created_on__lt=created_on)
+                               | Q(created_on=created_on, id__lt=report_id))
+        page = list(page[:chunk_size])
+        if not page:
+            return
+        attach_problems(page)
+        attach_labels(page)
+        yield page
+        if len(page) < chunk_size:
+            return
+        after = (page[-1].created_on, page[-1].pk)
+
+
+def merge_reports(streams):
+    ''' reports of streams, each ordered by (-created_on, -id), merged
+        in that order '''
+    heads = []
+    for stream in streams:
+        stream = iter(stream)
+        for report in stream:
+            heads.append([report, stream])
+            break
+    while heads:
+        index = max(range(len(heads)),
+                    key=lambda index: (heads[index][0].created_on,
+                                       heads[index][0].pk))
+        report, stream = heads[index]
+        yield report
+        try:
+            heads[index][0] = next(stream)
+        except StopIteration:
+            del heads[index]
+
+
+def report_pages(querysets, chunk_size=CHUNK_SIZE, after=None):
+    ''' keyset_pages of the Report queryset and of the archives ones
+        (see archive.report_querysets), merged by (-created_on, -id) '''
+    if len(querysets) == 1:
+        return keyset_pages(querysets[0], chunk_size, after)
+    return chunked(merge_reports(
+        chain.from_iterable(keyset_pages(queryset, chunk_size, after))
+        for queryset in querysets), chunk_size)
+
+
+def attach_problems(reports):
+    ''' sets report.problem_list on reports using a single query per
+        table (hot or archived) '''
+    taxonomy = get_taxonomy()
+    by_model = {}
+    for report in reports:
+        report.problem_list = []
+        by_model.setdefault(report.__class__, {})[report.pk] = report
+    for model, by_id in by_model.items():
+        links = model.problems.through.objects \
+                     .filter(report__in=list(by_id)) \
+                     .values_list('report', 'problem')
+        for report_id, slug in links:
+            problem = taxonomy.problem(slug)
+            if problem is not None:
+                by_id[report_id].problem_list.append(problem)
+    for report in reports:
+        report.problem_list.sort(key=lambda problem: problem.name)
+
+
+def attach_labels(reports):
+    ''' sets report.period_name on reports, rendering each period once '''
+    names = Period.labels([report.period for report in reports])
+    for report, name in zip(reports, names):
+        report.period_name = name
+
+
+def report_as_dict(report):
+    user = report.kuran_user
+    return {
+        'id': report.pk,
+        'created_on': report.created_on.isoformat(),
+        'username': user.username if user else None,
+        'user': user.full_name() if user else None,
+        'period': report.period_name,
+        'period_type': report.period.period_type,
+        'problems': [problem.slug for problem in report.problem_list],
+        'problem_names': [problem.name for problem in report.problem_list],
+        'categories': sorted(set(problem.category.name
+                                 for problem in report.problem_list)),
+    }
+
+
+class Echo(object):
+    ''' file-like object handing back what is written to it '''
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(querysets, chunk_size=CHUNK_SIZE):
+    ''' CSV lines, header first '''
+    writer = UnicodeWriter(Echo())
+    yield writer.writerow(CSV_FIELDS)
+    for page in report_pages(querysets, chunk_size):
+        for report in page:
+            row = report_as_dict(report)
+            yield writer.writerow(
+                [";".join(row[field]) if isinstance(row[field], list)
+                 else row[field] for field in CSV_FIELDS])
+
+
+def iter_jsonl(querysets, chunk_size=CHUNK_SIZE):
+    ''' one JSON object per line '''
+    for page in report_pages(querysets, chunk_size):
+        for report in page:
+            yield json.dumps(report_as_dict(report)) + "\n"
+
+
+def export(format='csv', period_id=None, category=None,
+           chunk_size=CHUNK_SIZE):
+    ''' generator of export lines in `format` (csv or jsonl) '''
+    period = Period.objects.get(id=period_id) if period_id else None
+    bounds = (period.start_on, period.end_on) if period else (None, None)
+    querysets = [filter_reports(queryset, period, category)
+                 for queryset in archive.report_querysets(*bounds)]
+    if format == 'jsonl':
+        return iter_jsonl(querysets, chunk_size)
+    return iter_csv(querysets, chunk_size)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Bulk ingestion of reports sent as JSON lines or CSV.
+
+Each report is a mapping with:
+
+ * created_on: ISO 8601 date or datetime
+ * username: optional KuranUser username
+ * problems: list of Problem slugs (';' or space separated in CSV)
+
+Reports are written per chunk: users and periods are resolved with a
+few set-based queries and problems from the taxonomy cache, then reports
+(ids assigned by the database), their problems and the rollups are
+written in one transaction. Invalid items are reported without stopping the batch. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import re
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import AutoField
+from django.utils import six, timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from kurantooro import calendar_engine, bucketing, rollups
+from kurantooro.taxonomy import get_taxonomy
+from kurantooro.models.Change import Change
+from kurantooro.models.Models import Report, KuranUser
+from kurantooro.utils import chunked, atomic, unicode_dict_reader
+
+CHUNK_SIZE = 500
+
+
+class IngestResult(object):
+    ''' number of reports created and (item number, error) list '''
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, number, message):
+        self.errors.append((number, message))
+
+    def as_dict(self):
+        return {'created': self.created,
+                'errors': [{'item': number, 'error': message}
+                           for number, message in self.errors]}
+
+
+def parse_jsonl(lines):
+    ''' records from JSON lines ; invalid lines yield a ValueError '''
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError("Invalid JSON: {}".format(e))
+
+
+def parse_csv(lines):
+    ''' records from CSV lines with a created_on,username,problems header '''
+    for row in unicode_dict_reader(lines):
+        row['problems'] = re.split(r'[;\s]+', row.get('problems') or '')
+        yield row
+
+
+def parse(lines, format='jsonl'):
+    if format == 'csv':
+        return parse_csv(lines)
+    return parse_jsonl(lines)
+
+
+def parse_created_on(value):
+    ''' datetime as stored in Report.created_on, from an ISO 8601 string '''
+    created_on = parse_datetime(value)
+    if created_on is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError("Invalid created_on: {}".format(value))
+        created_on = datetime(day.year, day.month, day.day)
+    tz = timezone.get_default_timezone()
+    if settings.USE_TZ and timezone.is_naive(created_on):
+        return timezone.make_aware(created_on, tz)
+    if not settings.USE_TZ and timezone.is_aware(created_on):
+        return timezone.make_naive(created_on, tz)
+    return created_on
+
+
+def clean_record(record):
+    ''' (created_on, username, [problem slugs]) from a raw record '''
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("A report must be an object")
+    created_on = record.get('created_on') or ''
+    if not isinstance(created_on, six.string_types):
+        raise ValueError("created_on must be a string")
+    username = record.get('username') or None
+    if username is not None and not isinstance(username, six.string_types):
+        raise ValueError("username must be a string")
+    problems = record.get('problems') or []
+    if not isinstance(problems, list) \
+            or not all(isinstance(slug, six.string_types) or slug is None
+                       for slug in problems):
+        raise ValueError("problems must be a list of slugs")
+    return (parse_created_on(created_on), username,
+            [slug for slug in problems if slug])
+
+
+def insert_reports(reports, using):
+    ''' INSERTs reports and sets their ids, assigned by the database.
+        Like bulk_create, sends no signal.
+
+    One multi-row INSERT per batch where the ids of its rows can be read
+    back: RETURNING on PostgreSQL ; on SQLite, whose write lock is held
+    until the transaction ends, the batch gets the rowids up to the last
+    one. Elsewhere, one INSERT per report. '''
+    fields = [field for field in Report._meta.local_fields
+              if not isinstance(field, AutoField)]
+    manager = Report.objects.db_manager(using)
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for report in reports:
+            report.pk = manager._insert([report], fields=fields,
+                                        return_id=True, using=using)
+        return
+
+    qn = connection.ops.quote_name
+    placeholder = "({})".format(", ".join(["%s"] * len(fields)))
+    sql_format = "INSERT INTO {table} ({columns}) VALUES {values}"
+    if connection.vendor == 'postgresql':
+        sql_format += " RETURNING {}".format(qn(Report._meta.pk.column))
+    cursor = connection.cursor()
+    # stay under SQLite's 999 parameters limit
+    for batch in chunked(reports, 999 // len(fields)):
+        params = []
+        for report in batch:
+            params.extend(field.get_db_prep_save(
+                getattr(report, field.attname), connection=connection)
+                for field in fields)
+        cursor.execute(sql_format.format(
+            table=qn(Report._meta.db_table),
+            columns=", ".join(qn(field.column) for field in fields),
+            values=", ".join([placeholder] * len(batch))), params)
+        if connection.vendor == 'postgresql':
+            ids = [row[0] for row in cursor.fetchall()]
+        else:
+            ids = range(cursor.lastrowid - len(batch) + 1,
+                        cursor.lastrowid + 1)
+        for report, report_id in zip(batch, ids):
+            report.pk = report_id
+
+
+def ingest_chunk(items, result):
+    ''' writes one chunk of (item number, record) pairs '''
+    cleaned = []
+    for number, record in items:
+        try:
+            cleaned.append((number,) + clean_record(record))
+        except ValueError as e:
+            result.add_error(number, "{}".format(e))
+
+    usernames = set(item[2] for item in cleaned if item[2])
+    slugs = set(slug for item in cleaned for slug in item[3])
+    users = dict(KuranUser.objects.filter(username__in=usernames)
+                                  .values_list('username', 'pk'))
+    taxonomy = get_taxonomy()
+    problems = dict((slug, taxonomy.problem(slug).category_id)
+                    for slug in slugs if taxonomy.problem(slug) is not None)
+
+    valid = []
+    for number, created_on, username, slugs in cleaned:
+        if username and username not in users:
+            result.add_error(number, "Unknown user: {}".format(username))
+        elif any(slug not in problems for slug in slugs):
+            result.add_error(number, "Unknown problem: {}".format(
+                ", ".join(slug for slug in slugs if slug not in problems)))
+        else:
+            valid.append((created_on, users.get(username), slugs))
+    if not valid:
+        return
+
+    days = bucketing.bucket_periods([item[0] for item in valid],
+                                    (calendar_engine.DAY,))
+    periods = days[calendar_engine.DAY]
+
+    using = router.db_for_write(Report)
+    through = Report.problems.through
+    reports = [Report(created_on=created_on, kuran_user_id=user_id,
+                      period_id=periods[offset].pk)
+               for offset, (created_on, user_id, slugs) in enumerate(valid)]
+    counts = Counter()
+    for offset, (created_on, user_id, slugs) in enumerate(valid):
+        for slug in set(slugs):
+            counts[(periods[offset].pk, slug, problems[slug], user_id)] += 1
+
+    # reports, links, journal and rollups commit (or fail) together
+    with atomic(using=using):
+        insert_reports(reports, using)
+        through.objects.using(using).bulk_create([
+            through(report_id=report.pk, problem_id=slug)
+            for report, (created_on, user_id, slugs) in zip(reports, valid)
+            for slug in set(slugs)])
+        Change.objects.using(using).bulk_create([
+            Change(model=Change.REPORT, object_id=report.pk,
+                   action=Change.UPSERT, owner=report.kuran_user_id)
+            for report in reports])
+        rollups.apply(counts)
+    result.created += len(valid)
+
+
+def ingest(records, chunk_size=CHUNK_SIZE):
+    ''' IngestResult of writing an iterable of records '''
+    result = IngestResult()
+    for items in chunked(enumerate(records, 1), chunk_size):
+        ingest_chunk(items, result)
+    return result
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from datetime import date
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from kurantooro import archive
+from kurantooro.models.Models import Report
+
+
+class Command(BaseCommand):
+    help = ("Moves the reports of the years before --before to per-year "
+            "archive tables. Interrupted runs resume where they stopped.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--before', type='int',
+                    default=date.today().year
+                    - getattr(settings, 'ARCHIVE_AFTER_YEARS', 2),
+                    help="First year kept in the Report table"),
+        make_option('--chunk-size', type='int', default=archive.CHUNK_SIZE,
+                    help="Number of reports moved per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        first = Report.objects.aggregate(
+            first=Min('period__start_on'))['first']
+        if first is None or first.year >= options['before']:
+            self.stdout.write("No report before {}.".format(options['before']))
+            return
+
+        for year in range(first.year, options['before']):
+            moved = 0
+            try:
+                for count in archive.archive_year(year, options['chunk_size']):
+                    moved += count
+                    self.stdout.write("{}: {} reports archived".format(year,
+                                                                       moved))
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write("{}: done ({} reports).".format(year, moved))
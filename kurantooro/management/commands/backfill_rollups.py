@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import multiprocessing
+import os
+from collections import Counter
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Min, Max
+
+from kurantooro import archive, calendar_engine, rollups
+from kurantooro.models.Models import Report
+
+
+def count_chunk(arguments):
+    ''' partial counts of the reports attached to periods starting
+        within one month or year '''
+    period_type, index = arguments
+    start_on, end_on = calendar_engine.PeriodSpec(period_type,
+                                                  index).boundaries()
+    counts = rollups.count_reports(
+        Report.objects.filter(period__start_on__gte=start_on,
+                              period__start_on__lte=end_on))
+    connection.close()
+    return index, [key + (count,) for key, count in counts.items()]
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the ProblemCount rollup table in parallel, "
+            "one month or year of reports per task")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--by', default=calendar_engine.MONTH,
+                    choices=[calendar_engine.MONTH, calendar_engine.YEAR],
+                    help="Size of the tasks: month or year"),
+        make_option('--processes', type='int',
+                    default=multiprocessing.cpu_count(),
+                    help="Number of worker processes"),
+        make_option('--state', default='backfill_rollups.json',
+                    help="File keeping track of the completed tasks"),
+        make_option('--resume', action='store_true', default=False,
+                    help="Continue from the tasks completed in --state"),
+    )
+
+    def load_state(self, path, period_type):
+        ''' completed indexes, merged counts and length of the valid part
+            of the state file: a header line then one JSON line per task '''
+        done, counts = set(), Counter()
+        with open(path, 'rb') as state_file:
+            header = json.loads(state_file.readline().decode('utf-8'))
+            if header['period_type'] != period_type:
+                raise CommandError("{} was written for --by {}"
+                                   .format(path, header['period_type']))
+            length = state_file.tell()
+            for line in iter(state_file.readline, b''):
+                try:
+                    task = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # last line cut by an interruption
+                    break
+                for row in task['counts']:
+                    counts[tuple(row[:-1])] += row[-1]
+                done.add(task['index'])
+                length = state_file.tell()
+        return done, counts, length
+
+    def open_state(self, path, period_type, length=None):
+        ''' state file opened for appending one line per task, truncated
+            to `length` when resuming '''
+        if length is not None:
+            state_file = open(path, 'r+b')
+            state_file.truncate(length)
+            state_file.seek(length)
+        else:
+            state_file = open(path, 'wb')
+            self.write_line(state_file, {'period_type': period_type})
+        return state_file
+
+    def write_line(self, state_file, data):
+        state_file.write((json.dumps(data) + "\n").encode('utf-8'))
+        state_file.flush()
+        os.fsync(state_file.fileno())
+
+    def handle(self, *args, **options):
+        period_type = options['by']
+        path = options['state']
+
+        bounds = Report.objects.aggregate(first=Min('period__start_on'),
+                                          last=Max('period__start_on'))
+        if bounds['first'] is None:
+            self.stdout.write("No report to count.")
+            return
+        first = calendar_engine.index_for(period_type, bounds['first'])
+        last = calendar_engine.index_for(period_type, bounds['last'])
+
+        done, counts, length = set(), Counter(), None
+        if options['resume'] and os.path.exists(path):
+            done, counts, length = self.load_state(path, period_type)
+        tasks = [(period_type, index) for index in range(first, last + 1)
+                 if index not in done]
+        total = last - first + 1
+
+        # workers must open their own database connection
+        connection.close()
+        state_file = self.open_state(path, period_type, length)
+        pool = multiprocessing.Pool(options['processes'])
+        try:
+            for index, rows in pool.imap_unordered(count_chunk, tasks):
+                for row in rows:
+                    counts[tuple(row[:-1])] += row[-1]
+                done.add(index)
+                self.write_line(state_file, {'index': index, 'counts': rows})
+                spec = calendar_engine.PeriodSpec(period_type, index)
+                self.stdout.write("[{}/{}] {:%Y-%m-%d} done".format(
+                    len(done), total, spec.start))
+        finally:
+            pool.close()
+            pool.join()
+            state_file.close()
+
+        counts.update(archive.count_archived())
+        rollups.replace(counts)
+        os.remove(path)
+        self.stdout.write("ProblemCount rebuilt from {} {}s."
+                          .format(total, period_type))
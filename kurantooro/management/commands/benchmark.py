@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from kurantooro import benchmarks
+
+
+def load_run(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        raise CommandError("Unable to read {}: {}".format(path, e))
+
+
+class Command(BaseCommand):
+    help = ("Times period resolution, renderers, ingestion and dashboard "
+            "on a throw-away database of growing size")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--scales',
+                    default='1000,10000,100000,1000000',
+                    help="Comma separated numbers of Period rows to seed"),
+        make_option('--lookups', type='int', default=1000,
+                    help="Number of calls timed per scenario and scale"),
+        make_option('--seed', type='int', default=0,
+                    help="Random seed for the synthetic data"),
+        make_option('--output',
+                    help="Writes the run as JSON to this file"),
+        make_option('--compare', metavar='BASELINE',
+                    help="JSON run to compare against"),
+        make_option('--current', metavar='RUN',
+                    help="With --compare, JSON run to compare "
+                         "instead of running the benchmarks"),
+        make_option('--metric', default='p50_us',
+                    choices=benchmarks.METRICS,
+                    help="Metric compared (default: p50_us)"),
+        make_option('--threshold', type='float', default=10,
+                    help="Slowdown, in percent, flagged as a regression"),
+    )
+
+    def handle(self, *args, **options):
+        if options['current']:
+            if not options['compare']:
+                raise CommandError("--current requires --compare")
+            run = load_run(options['current'])
+        else:
+            run = self.run(options)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(run, f, indent=2)
+        if not options['compare']:
+            if not options['output']:
+                self.stdout.write(json.dumps(run, indent=2))
+            return
+
+        regressions = benchmarks.compare(
+            load_run(options['compare'])['results'], run['results'],
+            options['metric'], options['threshold'])
+        for old, new, ratio in regressions:
+            self.stdout.write(
+                "REGRESSION {name} {type} @ {scale}: {old:.1f} -> {new:.1f} "
+                "{metric} (+{percent:.0f}%)".format(
+                    old=old[options['metric']], new=new[options['metric']],
+                    metric=options['metric'], percent=(ratio - 1) * 100,
+                    **new))
+        if regressions:
+            raise CommandError("{} regression(s) above {}%".format(
+                len(regressions), options['threshold']))
+        self.stdout.write("No regression above {}%"
+                          .format(options['threshold']))
+
+    def run(self, options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError("--scales must be a list of integers")
+
+        random.seed(options['seed'])
+        with benchmarks.TestDatabase():
+            results = benchmarks.run(scales, options['lookups'])
+        return {'vendor': connection.vendor,
+                'scales': scales,
+                'lookups': options['lookups'],
+                'seed': options['seed'],
+                'results': results}
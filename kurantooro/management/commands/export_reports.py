@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import codecs
+import io
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import six
+
+from kurantooro.exports import export, CHUNK_SIZE
+from kurantooro.models.Period import Period
+
+
+class Command(BaseCommand):
+    help = "Writes reports as CSV or JSON lines without loading them all"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default='csv', choices=['csv', 'jsonl'],
+                    help="Output format"),
+        make_option('--period', type='int', default=None,
+                    help="Only reports within this Period id"),
+        make_option('--category', default=None,
+                    help="Only reports with a problem of this Category slug"),
+        make_option('--output', default='-',
+                    help="Output file (default: stdout)"),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+                    dest='chunk_size',
+                    help="Number of reports read per query"),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            lines = export(options['format'], options['period'],
+                           options['category'], options['chunk_size'])
+        except Period.DoesNotExist:
+            raise CommandError("Unknown period: {}".format(options['period']))
+
+        if options['output'] == '-':
+            # Python 2's stdout takes bytes: unicode lines are encoded as
+            # ASCII (failing on accents) when it is not a terminal
+            output = sys.stdout if six.PY3 \
+                else codecs.getwriter('utf-8')(sys.stdout)
+        else:
+            output = io.open(options['output'], 'w', encoding='utf-8',
+                             newline='')
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if options['output'] != '-':
+                output.close()
+            else:
+                output.flush()
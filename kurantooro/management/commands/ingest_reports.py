@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import io
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kurantooro.ingest import ingest, parse, CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    args = "<file or ->"
+    help = "Creates reports in bulk from a JSON lines or CSV file"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', default=None, choices=['jsonl', 'csv'],
+                    help="Input format (guessed from the extension)"),
+        make_option('--chunk-size', type='int', default=CHUNK_SIZE,
+                    dest='chunk_size',
+                    help="Number of reports written per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Usage: ingest_reports {}".format(self.args))
+        path = args[0]
+        format = options['format'] \
+            or ('csv' if path.endswith('.csv') else 'jsonl')
+
+        start = time.time()
+        if path == '-':
+            result = ingest(parse(sys.stdin, format), options['chunk_size'])
+        else:
+            with io.open(path, encoding='utf-8', newline='') as lines:
+                result = ingest(parse(lines, format), options['chunk_size'])
+        duration = time.time() - start
+
+        for number, message in result.errors:
+            self.stderr.write("#{}: {}".format(number, message))
+        self.stdout.write("{} reports created in {:.1f}s ({} errors)."
+                          .format(result.created, duration,
+                                  len(result.errors)))
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.core.management.base import NoArgsCommand
+
+from kurantooro.models.Period import Period
+from kurantooro.models.PeriodHierarchy import PeriodHierarchy, HIERARCHY_TYPES
+from kurantooro.utils import chunked
+
+
+class Command(NoArgsCommand):
+    help = ("Fills the PeriodHierarchy closure table for existing calendar "
+            "periods. Existing links are left untouched.")
+
+    def handle_noargs(self, **options):
+        period_ids = Period.objects.filter(period_type__in=HIERARCHY_TYPES) \
+                                   .values_list('id', flat=True) \
+                                   .order_by('id')
+        count = 0
+        for chunk in chunked(period_ids.iterator(), 500):
+            count += len(PeriodHierarchy.link(
+                Period.objects.in_bulk(chunk).values()))
+        self.stdout.write("{} periods linked.".format(count))
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.core.management.base import NoArgsCommand
+
+from kurantooro import rollups
+
+
+class Command(NoArgsCommand):
+    help = "Recomputes the ProblemCount rollup table from all reports"
+
+    def handle_noargs(self, **options):
+        count = rollups.rebuild()
+        self.stdout.write("{} ProblemCount rows written.".format(count))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kurantooro import archive
+from kurantooro.models.Archive import ReportArchive
+
+
+class Command(BaseCommand):
+    args = "<year year ...>"
+    help = ("Moves archived reports back to the Report table and drops "
+            "their archive. Interrupted runs resume where they stopped.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=archive.CHUNK_SIZE,
+                    help="Number of reports moved per transaction"),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("Give the years to restore")
+        try:
+            years = [int(year) for year in args]
+        except ValueError:
+            raise CommandError("Years must be integers")
+
+        for year in years:
+            if not ReportArchive.objects.filter(year=year).exists():
+                raise CommandError("No archive for {}".format(year))
+            moved = 0
+            for count in archive.restore_year(year, options['chunk_size']):
+                moved += count
+                self.stdout.write("{}: {} reports restored".format(year,
+                                                                   moved))
+            self.stdout.write("{}: done ({} reports).".format(year, moved))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from datetime import date
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kurantooro import calendar_engine
+from kurantooro.models.Period import Period
+
+
+class Command(BaseCommand):
+    help = ("Creates the day, week, month, quarter and year periods of "
+            "a range of years. Existing periods are left untouched.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--from-year', type='int',
+                    default=date.today().year - 1,
+                    help="First year (default: last year)"),
+        make_option('--to-year', type='int',
+                    default=date.today().year + 5,
+                    help="Last year (default: in five years)"),
+        make_option('--types',
+                    default=",".join(calendar_engine.CALENDAR_TYPES),
+                    help="Comma separated period types"),
+        make_option('--chunk-size', type='int', default=1000,
+                    help="Number of periods created per statement"),
+    )
+
+    def handle(self, *args, **options):
+        if options['from_year'] > options['to_year']:
+            raise CommandError("--from-year is after --to-year")
+        period_types = [period_type.strip() for period_type
+                        in options['types'].split(',') if period_type.strip()]
+        for period_type in period_types:
+            if period_type not in calendar_engine.CALENDAR_TYPES:
+                raise CommandError("Unknown period type: {}"
+                                   .format(period_type))
+
+        for period_type in period_types:
+            count = Period.materialize(options['from_year'],
+                                       options['to_year'], (period_type,),
+                                       options['chunk_size'])
+            self.stdout.write("{count} {type} periods from {first} to {last}."
+                              .format(count=count, type=period_type,
+                                      first=options['from_year'],
+                                      last=options['to_year']))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from kurantooro import analytics
+
+
+class Command(BaseCommand):
+    help = ("Appends the reports created since the last run to the "
+            "columnar analytics snapshot")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--path',
+                    help="Snapshot directory "
+                         "(default: settings.ANALYTICS_SNAPSHOT_DIR)"),
+        make_option('--rebuild', action='store_true', default=False,
+                    help="Rewrites the snapshot from all reports"),
+        make_option('--chunk-size', type='int', default=analytics.CHUNK_SIZE,
+                    help="Number of reports read per query"),
+    )
+
+    def handle(self, *args, **options):
+        added = 0
+        for count in analytics.refresh(options['path'], options['chunk_size'],
+                                       options['rebuild']):
+            added += count
+            self.stdout.write("{} rows added".format(added))
+        snapshot = analytics.Snapshot.open(options['path'])
+        self.stdout.write("Snapshot: {rows} rows, last report #{last}."
+                          .format(rows=len(snapshot),
+                                  last=snapshot.meta['last_report_id']))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import multiprocessing
+import random
+import traceback
+from datetime import date
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from kurantooro import calendar_engine
+from kurantooro.models.Period import Period, period_cache
+
+
+def worker(arguments):
+    ''' ensures overlapping random sets of periods ; returns errors '''
+    seed, year, rounds = arguments
+    # each worker gets its own database connection
+    connection.close()
+    random.seed(seed)
+    year_spec = calendar_engine.PeriodSpec(calendar_engine.YEAR, year)
+    candidates = []
+    for period_type in (calendar_engine.DAY, calendar_engine.WEEK,
+                        calendar_engine.MONTH, calendar_engine.QUARTER):
+        candidates.extend(year_spec.subs(period_type))
+
+    errors = []
+    for _ in range(rounds):
+        period_cache.clear()
+        specs = random.sample(candidates, min(len(candidates), 50))
+        try:
+            found = Period.find_create_specs(specs)
+            if len(found) != len(specs):
+                errors.append("{} periods missing".format(
+                    len(specs) - len(found)))
+        except Exception:
+            errors.append(traceback.format_exc())
+    connection.close()
+    return errors
+
+
+class Command(BaseCommand):
+    help = ("Runs parallel workers creating the same periods against the "
+            "configured database and checks no duplicate nor error occurs")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=8,
+                    help="Number of concurrent processes"),
+        make_option('--rounds', type='int', default=20,
+                    help="Number of ensure_periods() calls per worker"),
+        make_option('--year', type='int', default=date.today().year + 1,
+                    help="Year whose periods are created"),
+    )
+
+    def handle(self, *args, **options):
+        name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite' and name in ('', ':memory:'):
+            raise CommandError("An on-disk database is required "
+                               "to share it between processes.")
+        connection.close()
+
+        pool = multiprocessing.Pool(options['workers'])
+        try:
+            results = pool.map(worker, [(seed, options['year'],
+                                         options['rounds'])
+                                        for seed in range(options['workers'])])
+        finally:
+            pool.close()
+            pool.join()
+
+        errors = [error for result in results for error in result]
+        for error in errors:
+            self.stderr.write(error)
+
+        duplicates = Period.objects.values('period_type', 'start_on',
+                                           'end_on') \
+                                   .annotate(count=Count('id')) \
+                                   .filter(count__gt=1).count()
+
+        self.stdout.write("{workers} workers x {rounds} rounds: "
+                          "{errors} errors, {duplicates} duplicates"
+                          .format(errors=len(errors), duplicates=duplicates,
+                                  **options))
+        if errors or duplicates:
+            raise CommandError("Concurrent period creation failed.")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.core.management.base import NoArgsCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction, DatabaseError
+
+from kurantooro.models.Models import Report
+from kurantooro.models.Period import Period, period_cache
+from kurantooro.utils import chunked, atomic
+
+# tables predating these models' indexes (syncdb never alters a table)
+INDEXED_MODELS = (Period, Report)
+
+
+class Command(NoArgsCommand):
+    help = ("Adds Period.key and the Period/Report indexes to databases "
+            "created before them, then recomputes Period.key of every "
+            "period")
+
+    def handle_noargs(self, **options):
+        added = self.add_key_column()
+        count = self.update_keys()
+        if added:
+            self.set_not_null()
+        indexes = self.create_indexes()
+        period_cache.clear()
+        self.stdout.write("{} period keys updated, {} indexes created."
+                          .format(count, indexes))
+
+    def add_key_column(self):
+        ''' adds the (nullable until filled) key column if missing '''
+        table = Period._meta.db_table
+        field = Period._meta.get_field('key')
+        cursor = connection.cursor()
+        columns = [row[0] for row in connection.introspection
+                   .get_table_description(cursor, table)]
+        if field.column in columns:
+            return False
+        qn = connection.ops.quote_name
+        cursor.execute("ALTER TABLE {table} ADD COLUMN {column} {type} NULL"
+                       .format(table=qn(table), column=qn(field.column),
+                               type=field.db_type(connection)))
+        transaction.commit_unless_managed()
+        return True
+
+    def update_keys(self):
+        count = 0
+        rows = Period.django.values_list('id', 'period_type', 'start_on') \
+                            .order_by('id')
+        for chunk in chunked(rows.iterator(), 1000):
+            with transaction.commit_on_success():
+                for period_id, period_type, start_on in chunk:
+                    # update(): neither save() nor its signals are needed
+                    Period.django.filter(id=period_id).update(
+                        key=Period(period_type=period_type,
+                                   start_on=start_on).compute_key())
+            count += len(chunk)
+        return count
+
+    def set_not_null(self):
+        ''' NOT NULL once filled ; SQLite can not alter a column and
+            keeps it nullable (save() always sets it) '''
+        table = Period._meta.db_table
+        field = Period._meta.get_field('key')
+        qn = connection.ops.quote_name
+        if connection.vendor == 'postgresql':
+            sql = "ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"
+        elif connection.vendor == 'mysql':
+            sql = "ALTER TABLE {table} MODIFY {column} {type} NOT NULL"
+        else:
+            return
+        connection.cursor().execute(sql.format(
+            table=qn(table), column=qn(field.column),
+            type=field.db_type(connection)))
+        transaction.commit_unless_managed()
+
+    def create_indexes(self):
+        ''' number of the indexes (db_index and index_together) created ;
+            the ones already there make their CREATE INDEX fail '''
+        created = 0
+        for model in INDEXED_MODELS:
+            for sql in connection.creation.sql_indexes_for_model(
+                    model, no_style()):
+                try:
+                    with atomic():
+                        connection.cursor().execute(sql)
+                except DatabaseError:
+                    continue
+                created += 1
+        return created
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger('kurantooro.requests')
+
+_state = threading.local()
+
+
+def timed_render(render):
+    ''' wraps Template.render to add the time of outermost renders
+        to the current request's template time '''
+    def wrapper(self, context):
+        if not getattr(_state, 'active', False) or _state.depth:
+            return render(self, context)
+        _state.depth += 1
+        start = time.time()
+        try:
+            return render(self, context)
+        finally:
+            _state.template_time += time.time() - start
+            _state.depth -= 1
+    wrapper.instrumented = True
+    return wrapper
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class QueryInstrumentationMiddleware(object):
+    ''' Records query count, SQL time, duplicate queries, view and template
+    time of each request. Sent as X-* response headers and logged as JSON
+    on the kurantooro.requests logger. Requests slower than
+    SLOW_REQUEST_THRESHOLD (ms) are logged as warnings with their SQL.
+
+    Enabled with settings.QUERY_INSTRUMENTATION ; removed from the
+    middleware chain otherwise. '''
+
+    def __init__(self):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD', 500)
+        if not getattr(Template.render, 'instrumented', False):
+            Template.render = timed_render(Template.render)
+
+    def process_request(self, request):
+        offsets = {}
+        for connection in connections.all():
+            connection.use_debug_cursor = True
+            offsets[connection.alias] = len(connection.queries)
+        _state.active = True
+        _state.depth = 0
+        _state.template_time = 0.0
+        request._instrumentation = {'start': time.time(),
+                                    'offsets': offsets}
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_instrumentation'):
+            request._instrumentation['view_start'] = time.time()
+
+    def process_response(self, request, response):
+        data = getattr(request, '_instrumentation', None)
+        if data is None:
+            return response
+        end = time.time()
+        _state.active = False
+
+        queries = []
+        for connection in connections.all():
+            queries.extend(connection.queries[
+                data['offsets'].get(connection.alias, 0):])
+            connection.use_debug_cursor = None
+        sql_time = sum(float(query['time']) for query in queries)
+        duplicates = sum(count - 1 for count in
+                         Counter(query['sql'] for query in queries).values()
+                         if count > 1)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': ms(end - data['start']),
+            'view_ms': ms(end - data.get('view_start', end)),
+            'template_ms': ms(_state.template_time),
+            'queries': len(queries),
+            'sql_ms': ms(sql_time),
+            'duplicates': duplicates,
+        }
+        response['X-Request-Time'] = record['total_ms']
+        response['X-View-Time'] = record['view_ms']
+        response['X-Template-Time'] = record['template_ms']
+        response['X-Query-Count'] = record['queries']
+        response['X-Query-Time'] = record['sql_ms']
+        response['X-Query-Duplicates'] = duplicates
+
+        if record['total_ms'] >= self.threshold:
+            record['sql'] = [query['sql'] for query in queries]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+        return response
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.db import models
+
+from py3compat import implements_to_string
+
+
+@implements_to_string
+class ReportArchive(models.Model):
+    ''' Reports of the periods of a year, moved out of the Report table
+    into their own report and problem link tables.
+
+    Managed by kurantooro.archive (archive_reports / restore_reports).
+    Reports are moved by chunks, each in its own transaction: a report is
+    always either in the hot table or in its archive. '''
+
+    class Meta:
+        app_label = 'kurantooro'
+        ordering = ('-year', )
+
+    ARCHIVING = 'archiving'
+    ARCHIVED = 'archived'
+    RESTORING = 'restoring'
+    STATUSES = ((ARCHIVING, "Archivage en cours"),
+                (ARCHIVED, "Archivé"),
+                (RESTORING, "Restauration en cours"))
+
+    year = models.PositiveIntegerField(unique=True, verbose_name="Année")
+    period = models.ForeignKey('Period', related_name='archives')
+    # Period.key range of the periods whose reports are archived
+    first_key = models.BigIntegerField()
+    last_key = models.BigIntegerField()
+    report_table = models.CharField(max_length=60)
+    link_table = models.CharField(max_length=60)
+    status = models.CharField(max_length=15, choices=STATUSES,
+                              default=ARCHIVING, verbose_name="Statut")
+    nb_reports = models.PositiveIntegerField(default=0,
+                                             verbose_name="Rapports")
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{year} ({status})".format(year=self.year,
+                                          status=self.get_status_display())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from py3compat import implements_to_string
+
+from kurantooro.models.Models import Report, Category, Problem
+
+
+@implements_to_string
+class Change(models.Model):
+    ''' Journal of the objects synced to offline clients.
+
+    The id is the change sequence. Only the last change of each object is
+    kept, plus a tombstone for each former owner of a report moved to
+    another user, so the journal stays about one row per object. '''
+
+    class Meta:
+        app_label = 'kurantooro'
+        index_together = [('model', 'object_id')]
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTIONS = ((UPSERT, "Création/Modification"), (DELETE, "Suppression"))
+
+    CATEGORY = 'category'
+    PROBLEM = 'problem'
+    REPORT = 'report'
+
+    model = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=50)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    # KuranUser owning a report ; only synced to that user
+    owner = models.IntegerField(null=True, blank=True, db_index=True)
+    created_on = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "#{id} {action} {model}:{object_id}".format(
+            id=self.id, action=self.action, model=self.model,
+            object_id=self.object_id)
+
+    @classmethod
+    def record(cls, model, object_id, action, owner=None):
+        previous = cls.objects.filter(model=model, object_id=object_id)
+        # former owners no longer sync the object: they get a tombstone
+        former_owners = [former for former in previous
+                         .filter(action=cls.UPSERT).exclude(owner=owner)
+                         .values_list('owner', flat=True)
+                         if former is not None]
+        previous.filter(Q(action=cls.UPSERT) | Q(owner=owner)).delete()
+        cls.objects.bulk_create([
+            cls(model=model, object_id=object_id, action=cls.DELETE,
+                owner=former) for former in former_owners])
+        cls.objects.create(model=model, object_id=object_id,
+                           action=action, owner=owner)
+
+
+SYNCED_MODELS = {Category: Change.CATEGORY,
+                 Problem: Change.PROBLEM,
+                 Report: Change.REPORT}
+
+
+def owner_of(instance):
+    return instance.kuran_user_id if isinstance(instance, Report) else None
+
+
+@receiver(post_save)
+def record_upsert(sender, instance, **kwargs):
+    if sender in SYNCED_MODELS:
+        Change.record(SYNCED_MODELS[sender], instance.pk, Change.UPSERT,
+                      owner_of(instance))
+
+
+@receiver(post_delete)
+def record_delete(sender, instance, **kwargs):
+    if sender in SYNCED_MODELS:
+        Change.record(SYNCED_MODELS[sender], instance.pk, Change.DELETE,
+                      owner_of(instance))
+
+
+@receiver(m2m_changed, sender=Report.problems.through)
+def record_report_problems(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Change.record(Change.REPORT, instance.pk, Change.UPSERT,
+                          instance.kuran_user_id)
+        return
+
+    # instance is a Problem
+    if action == 'pre_clear':
+        instance._sync_cleared = list(instance.problemes.all())
+        return
+    if action == 'post_clear':
+        reports = instance._sync_cleared
+    elif action in ('post_add', 'post_remove'):
+        reports = Report.objects.filter(pk__in=pk_set)
+    else:
+        return
+    for report in reports:
+        Change.record(Change.REPORT, report.pk, Change.UPSERT,
+                      report.kuran_user_id)
@@ -6,7 +6,10 @@ from __future__ import (unicode_literals, absolute_import,
                         division, print_function)
 
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 from py3compat import implements_to_string
 
@@ -19,7 +22,9 @@ class Report(models.Model):
         get_latest_by = "created_on"
         ordering = ('-created_on', '-id')
 
-    created_on = models.DateTimeField(auto_now_add=True)
+    # default rather than auto_now_add so bulk ingestion can set it
+    created_on = models.DateTimeField(default=timezone.now,
+                                      editable=False, db_index=True)
     problems = models.ManyToManyField('Problem', null=True, blank=True,
                                       verbose_name="Problemes",
                                       related_name='problemes')
@@ -75,3 +80,12 @@ class KuranUser(AbstractUser):
 
     def __str__(self):
         return self.full_name()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Problem)
+@receiver(post_delete, sender=Problem)
+def invalidate_taxonomy(sender, **kwargs):
+    from kurantooro import taxonomy
+    taxonomy.bump()
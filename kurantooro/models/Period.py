@@ -4,57 +4,127 @@
 
 from __future__ import (unicode_literals, absolute_import,
                         division, print_function)
+import logging
 from datetime import datetime, date, timedelta
 
-from django.db import models
+from django.conf import settings
+from django.db import models, DatabaseError
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.test.signals import setting_changed
 from django.utils import timezone
-from django.utils.translation import ugettext_lazy as _, ugettext
+from django.utils.translation import (ugettext_lazy as _, ugettext,
+                                      get_language)
 from django.utils.dateformat import format as date_format
 from django.utils.encoding import python_2_unicode_compatible
 
-from kurantooro.utils import normalize_date, next_month
+from kurantooro import calendar_engine
+from kurantooro.lru import LRUCache
+from kurantooro.models.PeriodHierarchy import PeriodHierarchy
+from kurantooro.utils import (normalize_date, db_datetime, bulk_insert_ignore,
+                              chunked)
 
-ONE_SECOND = 0.0001
-ONE_MICROSECOND = 0.00000000001
+logger = logging.getLogger(__name__)
 
+# per-process cache of resolved periods, keyed by (type, start_on, end_on).
+# Instances are shared between callers: do not modify them in place.
+period_cache = LRUCache(getattr(settings, 'PERIOD_CACHE_SIZE', 1024))
 
-class DayManager(models.Manager):
+# rendered names, keyed by (period key, language, name or full_name):
+# activating another language needs no invalidation. The cache lives as
+# long as the process, like Django's own translation catalogs: deploying
+# new translations or formats in production means a process restart.
+# setting_changed (override_settings, tests only) clears it.
+label_cache = LRUCache(getattr(settings, 'PERIOD_LABEL_CACHE_SIZE', 4096))
+LABEL_SETTINGS = ('LANGUAGE_CODE', 'LANGUAGES', 'LOCALE_PATHS', 'USE_I18N',
+                  'USE_L10N', 'FORMAT_MODULE_PATH', 'TIME_ZONE')
+
+# period_type -> proxy class, filled by register_period_type
+PERIOD_CLASSES = {}
+
+
+def ordinal(value):
+    ''' 1st, 2nd, 3rd, 4th... in the active language '''
+    try:
+        value = int(value)
+    except ValueError:
+        return value
+
+    if value % 100 // 10 != 1:
+        if value % 10 == 1:
+            # Translators: suffix for 1st
+            return "{:d}{}".format(value, ugettext("st"))
+        elif value % 10 == 2:
+            # Translators: suffix for 2nd
+            return "{:d}{}".format(value, ugettext("nd"))
+        elif value % 10 == 3:
+            # Translators: suffix for 3rd
+            return "{:d}{}".format(value, ugettext("rd"))
+    # Translators: suffix for 4th
+    return "{:d}{}".format(value, ugettext("th"))
+
+
+def register_period_type(cls):
+    ''' class decorator registering a Period proxy for its type() '''
+    PERIOD_CLASSES[cls.type()] = cls
+    return cls
+
+
+class PeriodQuerySet(models.query.QuerySet):
+    ''' QuerySet yielding periods already cast to their proxy class '''
+
+    def iterator(self):
+        for period in super(PeriodQuerySet, self).iterator():
+            if not period._deferred:
+                period.__class__ = PERIOD_CLASSES.get(period.period_type,
+                                                      Period)
+            yield period
+
+
+class PeriodManager(models.Manager):
+    use_for_related_fields = True
+
+    def get_query_set(self):
+        return PeriodQuerySet(self.model, using=self._db)
+
+
+class DayManager(PeriodManager):
     def get_query_set(self):
         return super(DayManager, self).get_query_set() \
                                       .filter(period_type=Period.DAY)
 
 
-class WeekManager(models.Manager):
+class WeekManager(PeriodManager):
     def get_query_set(self):
         return super(WeekManager, self).get_query_set() \
                                        .filter(period_type=Period.WEEK)
 
 
-class MonthManager(models.Manager):
+class MonthManager(PeriodManager):
     def get_query_set(self):
         return super(MonthManager, self).get_query_set() \
                                         .filter(period_type=Period.MONTH)
 
 
-class QuarterManager(models.Manager):
+class QuarterManager(PeriodManager):
     def get_query_set(self):
         return super(QuarterManager, self).get_query_set() \
                                           .filter(period_type=Period.QUARTER)
 
 
-class SemesterManager(models.Manager):
+class SemesterManager(PeriodManager):
     def get_query_set(self):
         return super(SemesterManager, self).get_query_set() \
                                            .filter(period_type=Period.SEMESTER)
 
 
-class YearManager(models.Manager):
+class YearManager(PeriodManager):
     def get_query_set(self):
         return super(YearManager, self).get_query_set() \
                                        .filter(period_type=Period.YEAR)
 
 
-class CustomManager(models.Manager):
+class CustomManager(PeriodManager):
     def get_query_set(self):
         return super(CustomManager, self).get_query_set() \
                                          .filter(period_type=Period.CUSTOM)
@@ -73,6 +143,7 @@ class Period(models.Model):
     class Meta:
         app_label = 'kurantooro'
         unique_together = ('start_on', 'end_on', 'period_type')
+        index_together = [('period_type', 'start_on', 'end_on')]
         verbose_name = _("Period")
         verbose_name_plural = _("Periods")
 
@@ -99,8 +170,11 @@ class Period(models.Model):
     period_type = models.CharField(max_length=15,
                                    choices=PERIOD_TYPES, default=CUSTOM,
                                    verbose_name=_("Type"))
+    # epoch seconds of start_on * 8 + type code ; see calendar_engine.
+    # Existing databases get the column from `update_period_keys`.
+    key = models.BigIntegerField(_("Key"), db_index=True, editable=False)
 
-    objects = models.Manager()
+    objects = PeriodManager()
     days = DayManager()
     weeks = WeekManager()
     months = MonthManager()
@@ -110,43 +184,58 @@ class Period(models.Model):
     customs = CustomManager()
     django = models.Manager()
 
+    def save(self, *args, **kwargs):
+        self.key = self.compute_key()
+        super(Period, self).save(*args, **kwargs)
+
+    def compute_key(self):
+        return calendar_engine.period_key(self.period_type, self.start_on)
+
+    def sort_key(self):
+        ''' key, computed if the period is not saved yet '''
+        return self.key if self.key is not None else self.compute_key()
+
     def __lt__(self, other):
         try:
-            return self.end_on < self.normalize_date(other.start_on)
-        except:
+            return self.sort_key() < other.sort_key()
+        except AttributeError:
             return NotImplemented
 
     def __le__(self, other):
         try:
-            return self.end_on <= self.normalize_date(other.end_on)
-        except:
+            return self.sort_key() <= other.sort_key()
+        except AttributeError:
             return NotImplemented
 
     def __eq__(self, other):
         try:
-            return self.pid == other.pid
-        except:
+            if self.sort_key() != other.sort_key():
+                return False
+        except AttributeError:
             return NotImplemented
+        # custom periods may share a start
+        return self.period_type != self.CUSTOM \
+            or self.end_on == self.normalize_date(other.end_on)
 
     def __ne__(self, other):
-        try:
-            return self.start_on != self.normalize_date(other.start_on) \
-                or self.end_on != self.normalize_date(other.end_on)
-        except:
-            return NotImplemented
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
 
     def __gt__(self, other):
         try:
-            return self.start_on > self.normalize_date(other.end_on)
-        except:
+            return self.sort_key() > other.sort_key()
+        except AttributeError:
             return NotImplemented
 
     def __ge__(self, other):
         try:
-            return self.start_on >= self.normalize_date(other.start_on)
-        except:
+            return self.sort_key() >= other.sort_key()
+        except AttributeError:
             return NotImplemented
 
+    def __hash__(self):
+        return hash(self.sort_key())
+
     def normalize_date(self, obj):
         return normalize_date(obj, as_aware=self.is_aware())
 
@@ -161,15 +250,16 @@ class Period(models.Model):
         return not self.is_aware()
 
     def list_of_subs(self, cls):
+        ''' periods of cls starting within this one, first one including
+            start_on. Computed from boundaries ; O(1) queries. '''
         if cls == self.__class__:
             return [self]
-        d = []
-        n = cls.find_create_by_date(self.start_on, dont_create=True)
-        while n.start_on <= self.end_on:
-            d.append(n)
-            n = cls.find_create_by_date(n.start_on + timedelta(cls.delta()),
-                                        dont_create=True)
-        return d
+        spec = calendar_engine.spec_for(cls.type(), self.start_on)
+        last = calendar_engine.spec_for(cls.type(), self.end_on)
+        specs = [calendar_engine.PeriodSpec(cls.type(), index)
+                 for index in range(spec.index, last.index + 1)]
+        found = cls.find_create_specs(specs)
+        return [found[spec] for spec in specs]
 
     def cast(self, cls):
         self.__class__ = cls
@@ -211,7 +301,7 @@ class Period(models.Model):
     @property
     def pid(self):
         ''' A locale safe identifier of the period '''
-        return self.middle().strftime('%s')
+        return self.sort_key()
 
     def middle(self):
         ''' datetime at half of the period duration '''
@@ -220,29 +310,114 @@ class Period(models.Model):
     def __str__(self):
         return self.name()
 
+    @property
+    def cache_key(self):
+        return (self.period_type,
+                normalize_date(self.start_on, as_aware=True),
+                normalize_date(self.end_on, as_aware=True))
+
+    @classmethod
+    def cache_stats(cls):
+        ''' hits, misses and evictions of the resolved periods cache '''
+        return period_cache.stats()
+
+    @classmethod
+    def from_cache(cls, key):
+        ''' cached period for (type, start_on, end_on) or None '''
+        return period_cache.get(key)
+
+    def typed(self):
+        ''' this period, cast to the proxy class of its period_type '''
+        if self.__class__ is Period:
+            self.cast(PERIOD_CLASSES.get(self.period_type, Period))
+        return self
+
     def name(self):
-        try:
-            cls = eval("{}Period".format(self.period_type.title()))
-            return cls.objects.get(id=self.id).name()
-        except:
-            # TRANSLATORS: Django date format for Generic .name()
-            return date_format(self.middle(), ugettext("c"))
+        return self.label('name')
+
+    def full_name(self):
+        return self.label('full_name')
+
+    def label(self, which):
+        ''' name or full_name, memoized per period and language '''
+        return Period.labels([self], which)[0]
+
+    def label_key(self, which, language):
+        if self.period_type == self.CUSTOM:
+            # custom periods may share a start
+            return (self.sort_key(), self.end_on, language, which)
+        return (self.sort_key(), language, which)
+
+    @classmethod
+    def labels(cls, periods, which='name'):
+        ''' list of the name or full_name of periods in the active
+            language, each missing label rendered once '''
+        language = get_language()
+        found = {}
+        labels = []
+        for period in periods:
+            key = period.label_key(which, language)
+            label = found.get(key)
+            if label is None:
+                label = label_cache.get(key)
+                if label is None:
+                    label = getattr(period.typed(), 'render_' + which)()
+                    label_cache.set(key, label)
+                found[key] = label
+            labels.append(label)
+        return labels
+
+    def render_name(self):
+        # TRANSLATORS: Django date format for Generic .name()
+        return date_format(self.middle(), ugettext("c"))
+
+    def render_full_name(self):
+        return self.render_name()
 
     def strid(self):
-        return self.middle().strftime('%s')
+        # delegate once: proxies without their own strid() end up here
+        if self.__class__ is Period and self.typed().__class__ is not Period:
+            return self.strid()
+        return "{}".format(calendar_engine.epoch_seconds(self.middle()))
 
-    def full_name(self):
-        return self.name()
+    def spec(self):
+        ''' calendar_engine.PeriodSpec of this period (None for custom) '''
+        try:
+            return calendar_engine.spec_for(self.period_type, self.start_on)
+        except ValueError:
+            return None
 
     def following(self):
         ''' returns next period in time '''
-        return self.find_create_by_date(self.middle()
-                                        + timedelta(self.delta()))
+        spec = self.spec()
+        if spec is None:
+            return self.find_create_by_date(self.middle()
+                                            + timedelta(self.delta()))
+        return self.find_create_with(*spec.following().boundaries(),
+                                     period_type=self.period_type)
 
     def previous(self):
-        ''' returns next period in time '''
-        return self.find_create_by_date(self.middle()
-                                        - timedelta(self.delta()))
+        ''' returns previous period in time '''
+        spec = self.spec()
+        if spec is None:
+            return self.find_create_by_date(self.middle()
+                                            - timedelta(self.delta()))
+        return self.find_create_with(*spec.previous().boundaries(),
+                                     period_type=self.period_type)
+
+    def ancestors(self):
+        ''' coarser calendar periods including this one, finest first '''
+        ancestors = Period.objects.filter(descendant_links__descendant=self) \
+                                  .exclude(pk=self.pk)
+        return sorted(ancestors, key=lambda period:
+                      calendar_engine.PERIOD_TYPES.index(period.period_type))
+
+    def descendants(self, cls=None):
+        ''' queryset of the finer calendar periods included in this one,
+            of cls only if set, ordered by start_on '''
+        manager = cls.objects if cls is not None else Period.objects
+        return manager.filter(ancestor_links__ancestor=self) \
+                      .exclude(pk=self.pk).order_by('start_on')
 
     @classmethod
     def boundaries(cls, date_obj):
@@ -277,11 +452,10 @@ class Period(models.Model):
 
         if not week and not month:
             # assume year search
-            sy = datetime(year, 1, 1, 0, 0, tzinfo=timezone.utc)
-            ey = sy.replace(year=year + 1) - timedelta(ONE_MICROSECOND)
+            sy, ey = calendar_engine.PeriodSpec(cls.YEAR, year).boundaries()
             try:
-                period = cls.objects.filter(start_on__lte=sy,
-                                            end_on__gte=ey)[0]
+                period = cls.objects.filter(start_on__lte=db_datetime(sy),
+                                            end_on__gte=db_datetime(ey))[0]
             except IndexError:
                 period = cls.find_create_with(sy, ey)
             return period
@@ -307,25 +481,117 @@ class Period(models.Model):
     def find_create_by_date(cls, date_obj, dont_create=False):
         ''' creates a period to fit the provided date in '''
         if not isinstance(date_obj, datetime):
-            date_obj = datetime.fromtimestamp(float(date_obj.strftime('%s')))
             date_obj = datetime(date_obj.year, date_obj.month,
-                                date_obj.day, date_obj.hour,
-                                date_obj.minute, 1,
+                                date_obj.day, 0, 0, 1,
                                 tzinfo=timezone.utc)
 
         date_obj = normalize_date(date_obj, as_aware=True)
+        if cls.type() != cls.CUSTOM:
+            period = cls.from_cache((cls.type(),) + cls.boundaries(date_obj))
+            if period is not None:
+                return period
         try:
-            period = [period for period in cls.objects.all()
-                      if period.start_on <= date_obj
-                      and period.end_on >= date_obj][0]
+            # range query on the (period_type, start_on, end_on) index
+            period = cls.objects.filter(start_on__lte=db_datetime(date_obj),
+                                        end_on__gte=db_datetime(date_obj)) \
+                                .order_by('-start_on')[0]
+            period_cache.set(period.cache_key, period)
         except IndexError:
-
+            # find_create_with() always persists the period
             period = cls.find_create_with(*cls.boundaries(date_obj))
-            if dont_create:
-                return period
-            period.save()
         return period
 
+    @classmethod
+    def find_create_specs(cls, specs):
+        ''' {spec: period} for an iterable of calendar_engine.PeriodSpec '''
+        specs = set(specs)
+        found = cls.ensure_periods([(spec.start, spec.end, spec.period_type)
+                                    for spec in specs])
+        return dict((spec, found[spec.cache_key]) for spec in specs)
+
+    @classmethod
+    def materialize(cls, first_year, last_year,
+                    period_types=calendar_engine.CALENDAR_TYPES,
+                    chunk_size=1000):
+        ''' ensures the periods of period_types covering the years
+            first_year..last_year exist, chunk_size at a time.
+            Returns the number of periods. '''
+        count = 0
+        for period_type in period_types:
+            for specs in chunked(calendar_engine.year_specs(
+                    first_year, last_year, period_type), chunk_size):
+                count += len(cls.find_create_specs(specs))
+        return count
+
+    @classmethod
+    def warm_cache(cls):
+        ''' materializes and caches the periods around the current year,
+            as set by settings.PERIOD_CACHE_WARMUP (years before, after) '''
+        years = getattr(settings, 'PERIOD_CACHE_WARMUP', None)
+        if not years:
+            return 0
+        before, after = years
+        year = date.today().year
+        try:
+            return cls.materialize(year - before, year + after)
+        except DatabaseError as e:
+            logger.warning("Period cache not warmed: {}".format(e))
+            return 0
+
+    @classmethod
+    def fetch_periods(cls, keys):
+        ''' {(type, start_on, end_on): period} of the existing periods
+            for those keys, using a single range query '''
+        keys = set(keys)
+        if not keys:
+            return {}
+        found = {}
+        period_keys = [calendar_engine.period_key(period_type, start_on)
+                       for period_type, start_on, end_on in keys]
+        periods = Period.objects.filter(
+            period_type__in=set(key[0] for key in keys),
+            key__gte=min(period_keys), key__lte=max(period_keys))
+        for period in periods:
+            if period.cache_key in keys:
+                found[period.cache_key] = period
+        return found
+
+    @classmethod
+    def ensure_periods(cls, boundaries):
+        ''' {(type, start_on, end_on): period} for a list of
+            (start_on, end_on, period_type), creating the missing ones.
+
+        Safe to call from concurrent processes: missing rows are inserted
+        with a single conflict-tolerant INSERT before being read back. '''
+        wanted = set((period_type,
+                      normalize_date(start_on, as_aware=True),
+                      normalize_date(end_on, as_aware=True))
+                     for start_on, end_on, period_type in boundaries)
+
+        found = {}
+        for key in wanted:
+            period = period_cache.get(key)
+            if period is not None:
+                found[key] = period
+
+        missing = wanted.difference(found)
+        if missing:
+            found.update(cls.fetch_periods(missing))
+            missing = wanted.difference(found)
+        if missing:
+            bulk_insert_ignore(
+                Period, ('period_type', 'start_on', 'end_on', 'key'),
+                [(period_type, start_on, end_on,
+                  calendar_engine.period_key(period_type, start_on))
+                 for period_type, start_on, end_on in missing])
+            created = cls.fetch_periods(missing)
+            found.update(created)
+            PeriodHierarchy.link(created.values())
+
+        for key, period in found.items():
+            period_cache.set(key, period)
+        return found
+
     @classmethod
     def find_create_with(cls, start_on, end_on, period_type=None):
         ''' creates a period with defined start and end dates '''
@@ -333,51 +599,26 @@ class Period(models.Model):
         end_on = normalize_date(end_on, as_aware=True)
         if not period_type:
             period_type = cls.type()
-        try:
-            period = cls.objects.get(start_on=start_on,
-                                     end_on=end_on, period_type=period_type)
-        except cls.DoesNotExist:
-            period = cls(start_on=start_on, end_on=end_on,
-                         period_type=period_type)
-            period.save()
-        return period
+        key = (period_type, start_on, end_on)
+        return cls.ensure_periods([(start_on, end_on, period_type)])[key]
 
     @classmethod
     def find_create_by_weeknum(cls, year, weeknum, is_iso=False):
+        ''' calendar (Monday-started) week number weeknum of year.
 
-        # version 1
-        # sw, ew = week_from_weeknum(year, week, is_iso=is_iso)
-        # period = cls.find_create_with(sw, ew)
-        # return period
-
-        # version 2
-        # soy = date(year, 1, 1)
-        # d = soy + timedelta(WeekPeriod.delta() * weeknum)
-        # return cls.find_create_by_date(d)
-
-        sy = datetime(year, 1, 1, 0, 0, tzinfo=timezone.utc)
-        # ey = datetime(year, 12, 31, 23, 59)
-        ONE_WEEK = WeekPeriod.delta()
-
-        # retrieve start of year day
-        sy_dow = sy.isoweekday() if is_iso else sy.weekday()
-
-        # find first real week (first Mon/Sun)
-        if sy_dow != 0:
-            sy = sy + timedelta(ONE_WEEK - sy_dow)
-
-        # if we want first week, it's from Jan 1st to next Mon/Sun
-        if weeknum == 0:
-            start_week = sy
-            end_week = start_week + timedelta(ONE_WEEK - sy_dow) \
-                - timedelta(ONE_SECOND)
+        is_iso: ISO 8601 numbering, week 1 includes January 4th.
+        Otherwise week 1 starts on the first Monday of the year and
+        week 0 is the week including January 1st. '''
+        if is_iso:
+            first = calendar_engine.spec_for(cls.WEEK, date(year, 1, 4))
         else:
-            weeknum -= 1  # cause we've set start as first real week
-            start_week = sy + timedelta(ONE_WEEK * weeknum)
-            end_week = start_week + timedelta(ONE_WEEK) - timedelta(ONE_SECOND)
-
-        period = cls.find_create_with(start_week, end_week)
-        return period
+            first = calendar_engine.spec_for(cls.WEEK, date(year, 1, 1))
+            if weeknum == 0:
+                return cls.find_create_specs([first])[first]
+            if date(year, 1, 1).weekday() != 0:
+                first = first.following()
+        spec = calendar_engine.PeriodSpec(cls.WEEK, first.index + weeknum - 1)
+        return cls.find_create_specs([spec])[spec]
 
     @classmethod
     def find_create_by_quarter(cls, year, quarter):
@@ -390,6 +631,7 @@ class Period(models.Model):
                                        dont_create=dont_create)
 
 
+@register_period_type
 class DayPeriod(Period):
 
     class Meta:
@@ -404,11 +646,11 @@ class DayPeriod(Period):
     def type(cls):
         return cls.DAY
 
-    def name(self):
+    def render_name(self):
         # Translators: Django's date format for DayPeriod.name()
         return date_format(self.middle(), ugettext("g/d/y"))
 
-    def full_name(self):
+    def render_full_name(self):
         # Translators: Django's date format for DayPeriod.full_name()
         return date_format(self.middle(), ugettext("F d Y"))
 
@@ -418,17 +660,13 @@ class DayPeriod(Period):
 
     @classmethod
     def boundaries(cls, date_obj):
-        date_obj = normalize_date(date_obj, as_aware=True)
-
-        start = date_obj.replace(hour=0, minute=0,
-                                 second=0, microsecond=0)
-        end = start + timedelta(cls.delta()) - timedelta(ONE_MICROSECOND)
-        return (start, end)
+        return calendar_engine.boundaries(cls.type(), date_obj)
 
     def strid(self):
         return self.middle().strftime('%d-%m-%Y')
 
 
+@register_period_type
 class WeekPeriod(Period):
 
     class Meta:
@@ -443,20 +681,16 @@ class WeekPeriod(Period):
     def type(cls):
         return cls.WEEK
 
-    @property
-    def pid(self):
-        return'W{}'.format(self.middle().strftime('%W-%Y'))
-
-    def name(self):
+    def render_name(self):
         # Translators: Django's date format for WeekPeriod.name()
         return date_format(self.middle(), ugettext("W/Y"))
 
-    def full_name(self):
+    def render_full_name(self):
         # Translators: Week Full name representation: weeknum, start and end
-        return ugettext("Week %(weeknum)s (%(start)s to %(end)s)".format(
-            weeknum=date_format(self.middle(), ugettext("W")),
-            start=date_format(self.start_on, ugettext("d")),
-            end=date_format(self.end_on, ugettext("d F Y"))))
+        return ugettext("Week %(weeknum)s (%(start)s to %(end)s)") % {
+            'weeknum': date_format(self.middle(), ugettext("W")),
+            'start': date_format(self.start_on, ugettext("d")),
+            'end': date_format(self.end_on, ugettext("d F Y"))}
 
     @classmethod
     def delta(self):
@@ -464,17 +698,13 @@ class WeekPeriod(Period):
 
     @classmethod
     def boundaries(cls, date_obj):
-        date_obj = normalize_date(date_obj, as_aware=True)
-
-        start = date_obj - timedelta(date_obj.weekday())
-        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = start + timedelta(cls.delta()) - timedelta(ONE_MICROSECOND)
-        return (start, end)
+        return calendar_engine.boundaries(cls.type(), date_obj)
 
     def strid(self):
         return self.middle().strftime('W%W-%Y')
 
 
+@register_period_type
 class MonthPeriod(Period):
 
     class Meta:
@@ -489,15 +719,11 @@ class MonthPeriod(Period):
     def type(cls):
         return cls.MONTH
 
-    @property
-    def pid(self):
-        return self.middle().strftime('%m%Y')
-
-    def name(self):
+    def render_name(self):
         # Translators: Django's date template format for MonthPeriod.name()
         return date_format(self.middle(), ugettext("F Y"))
 
-    def full_name(self):
+    def render_full_name(self):
         # Translators: Django's date template format for MonthPeriod.full_name()
         return date_format(self.middle(), ugettext("F Y"))
 
@@ -507,20 +733,13 @@ class MonthPeriod(Period):
 
     @classmethod
     def boundaries(cls, date_obj):
-        date_obj = normalize_date(date_obj, as_aware=True)
-
-        nyear, nmonth = next_month(date_obj.year, date_obj.month)
-
-        start = date_obj.replace(day=1, hour=0, minute=0,
-                                 second=0, microsecond=0)
-        end = start.replace(year=nyear, month=nmonth) \
-            - timedelta(ONE_MICROSECOND)
-        return (start, end)
+        return calendar_engine.boundaries(cls.type(), date_obj)
 
     def strid(self):
         return self.middle().strftime('%m-%Y')
 
 
+@register_period_type
 class QuarterPeriod(Period):
 
     class Meta:
@@ -537,60 +756,24 @@ class QuarterPeriod(Period):
 
     @property
     def quarter(self):
-        m = self.middle().month
-        if m in (1, 2, 3):
-            return 1
-        elif m in (4, 5, 6):
-            return 2
-        elif m in (7, 8, 9):
-            return 3
-        else:
-            return 4
+        return (self.middle().month - 1) // 3 + 1
 
-    @property
-    def pid(self):
-        return 'Q{:d}.{}'.format((self.quarter, self.middle().strftime('%Y')))
-
-    def name(self):
+    def render_name(self):
         # Translators: django date format for accompagning Quarter in Quarter.name()
         drepr = date_format(self.middle(), ugettext("Y"))
         # Translators: Quarter.name() repr using Quarter number and other
-        return ugettext("Q%(quarter)s.%(year)s").format(
-            year=drepr,
-            quarter=self.quarter)
-
-    def full_name(self):
-        def ordinal(value):
-            try:
-                value = int(value)
-            except ValueError:
-                return value
-
-            if value % 100 // 10 != 1:
-                if value % 10 == 1:
-                    # Translators: suffix for 1st
-                    ordval = "{:d}{}".format((value, ugettext("st")))
-                elif value % 10 == 2:
-                    # Translators: suffix for 2nd
-                    ordval = "{:d}{}".format((value, ugettext("nd")))
-                elif value % 10 == 3:
-                    # Translators: suffix for 3rd
-                    ordval = "{:d}{}".format((value, ugettext("rd")))
-                else:
-                    # Translators: suffix for 4th
-                    ordval = "{:d}{}".format((value, ugettext("th")))
-            else:
-                # Translators: suffix for 5th
-                ordval = "{:d}{}".format((value, ugettext("th")))
-
-            return ordval
-
-        # Translators: Django's date format for QuarterPeriod.full_name()
-        return "%(ordinal_quarter)s Quarter %(year)s (%(start)s to %(end)s)".format(
-            ordinal_quarter=ordinal(self.quarter),
-            year=date_format(self.middle(), ugettext("Y")),
-            start=date_format(self.start_on, ugettext("F")),
-            end=date_format(self.end_on, ugettext("F Y")))
+        return ugettext("Q%(quarter)s.%(year)s") % {'year': drepr,
+                                                    'quarter': self.quarter}
+
+    def render_full_name(self):
+        # Translators: QuarterPeriod.full_name(), e.g. 1st Quarter 2013
+        # (January to March 2013)
+        return ugettext("%(ordinal_quarter)s Quarter %(year)s "
+                        "(%(start)s to %(end)s)") % {
+            'ordinal_quarter': ordinal(self.quarter),
+            'year': date_format(self.middle(), ugettext("Y")),
+            'start': date_format(self.start_on, ugettext("F")),
+            'end': date_format(self.end_on, ugettext("F Y"))}
 
     @classmethod
     def delta(self):
@@ -598,34 +781,14 @@ class QuarterPeriod(Period):
 
     @classmethod
     def boundaries(cls, date_obj):
-
-        date_obj = normalize_date(date_obj, as_aware=True)
-
-        clean_start = date_obj.replace(month=1, day=1, hour=0, minute=0,
-                                       second=0, microsecond=0)
-        clean_end = clean_start - timedelta(ONE_MICROSECOND)
-        clean_end = clean_end.replace(year=date_obj.year)
-
-        if date_obj.month in (1, 2, 3):
-            start = clean_start.replace(month=1)
-            end = start.replace(month=4) - timedelta(ONE_MICROSECOND)
-        elif date_obj.month in (4, 5, 6):
-            start = clean_start.replace(month=4)
-            end = start.replace(month=7) - timedelta(ONE_MICROSECOND)
-        elif date_obj.month in (7, 8, 9):
-            start = clean_start.replace(month=7)
-            end = start.replace(month=10) - timedelta(ONE_MICROSECOND)
-        else:
-            start = clean_start.replace(month=10)
-            end = clean_end
-
-        return (start, end)
+        return calendar_engine.boundaries(cls.type(), date_obj)
 
     def strid(self):
         return 'Q{}-{}'.format(str(self.quarter).zfill(2),
                                self.middle().strftime('%Y'))
 
 
+@register_period_type
 class YearPeriod(Period):
 
     class Meta:
@@ -640,12 +803,12 @@ class YearPeriod(Period):
     def type(cls):
         return cls.YEAR
 
-    def name(self):
+    def render_name(self):
         # Translators: Django's date format for YearPeriod.name()
         return date_format(self.middle(), ugettext("F"))
 
-    def full_name(self):
-        return self.name()
+    def render_full_name(self):
+        return self.render_name()
 
     @classmethod
     def delta(self):
@@ -653,12 +816,32 @@ class YearPeriod(Period):
 
     @classmethod
     def boundaries(cls, date_obj):
-        date_obj = normalize_date(date_obj, as_aware=True)
-
-        start = date_obj.replace(month=0, day=0, hour=0, minute=0,
-                                 second=0, microsecond=0)
-        end = start.replace(year=date_obj.year + 1) - timedelta(ONE_MICROSECOND)
-        return (start, end)
+        return calendar_engine.boundaries(cls.type(), date_obj)
 
     def strid(self):
         return self.middle().strftime('%Y')
+
+
+@receiver(post_save)
+def invalidate_period_cache_on_save(sender, instance, created, **kwargs):
+    if not isinstance(instance, Period):
+        return
+    if created:
+        period_cache.discard(instance.cache_key)
+        PeriodHierarchy.link([instance])
+    else:
+        # boundaries of an existing period may have changed
+        period_cache.clear()
+
+
+@receiver(post_delete)
+def invalidate_period_cache_on_delete(sender, instance, **kwargs):
+    if isinstance(instance, Period):
+        period_cache.clear()
+
+
+@receiver(setting_changed)
+def clear_label_cache(sender, setting, **kwargs):
+    # only sent by override_settings: production needs a restart
+    if setting in LABEL_SETTINGS:
+        label_cache.clear()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.db import models
+
+from py3compat import implements_to_string
+
+from kurantooro import calendar_engine
+from kurantooro.utils import bulk_insert_ignore, chunked
+
+HIERARCHY_TYPES = calendar_engine.CALENDAR_TYPES
+
+
+@implements_to_string
+class PeriodHierarchy(models.Model):
+    ''' Closure table of the calendar periods.
+
+    One row links a period to each coarser calendar period including its
+    middle (day > week > month > quarter > year), plus one row to itself.
+    A week belongs to the month of its Thursday, as in rollups.
+
+    Reports of a quarter, by week, in a single query:
+
+        PeriodHierarchy.objects \\
+            .filter(ancestor_type=Period.WEEK,
+                    descendant__ancestor_links__ancestor=quarter) \\
+            .values('ancestor').annotate(nb=Count('descendant__report')) '''
+
+    class Meta:
+        app_label = 'kurantooro'
+        unique_together = ('ancestor', 'descendant')
+        index_together = [('ancestor', 'descendant_type'),
+                          ('descendant', 'ancestor_type')]
+
+    ancestor = models.ForeignKey('Period', related_name='descendant_links')
+    descendant = models.ForeignKey('Period', related_name='ancestor_links')
+    # copies of the periods' types: filtering on them costs no join
+    ancestor_type = models.CharField(max_length=15)
+    descendant_type = models.CharField(max_length=15)
+
+    def __str__(self):
+        return "{}/{}".format(self.ancestor_id, self.descendant_id)
+
+    @classmethod
+    def link(cls, periods):
+        ''' {period_id: [ids of the period and its ancestors]} for calendar
+            periods, inserting their missing closure rows '''
+        from kurantooro.models.Period import Period
+        specs = {}
+        for period in periods:
+            if period.period_type not in HIERARCHY_TYPES:
+                continue
+            level = HIERARCHY_TYPES.index(period.period_type)
+            specs[period.pk] = (period, [
+                calendar_engine.spec_for(period_type, period.middle())
+                for period_type in HIERARCHY_TYPES[level + 1:]])
+
+        found = Period.find_create_specs(
+            set(spec for period, period_specs in specs.values()
+                for spec in period_specs))
+        rows, linked = [], {}
+        for period, period_specs in specs.values():
+            ancestors = [period] + [found[spec] for spec in period_specs]
+            rows.extend((ancestor.pk, period.pk, ancestor.period_type,
+                         period.period_type) for ancestor in ancestors)
+            linked[period.pk] = [ancestor.pk for ancestor in ancestors]
+        bulk_insert_ignore(cls, ('ancestor', 'descendant', 'ancestor_type',
+                                 'descendant_type'), rows)
+        return linked
+
+    @classmethod
+    def ancestor_ids(cls, period_ids):
+        ''' {period_id: [ids of the period and its ancestors]}, linking the
+            calendar periods created before the closure table '''
+        from kurantooro.models.Period import Period
+        period_ids = set(period_ids)
+        linked = dict((period_id, []) for period_id in period_ids)
+        for chunk in chunked(period_ids, 500):
+            for descendant, ancestor in cls.objects \
+                    .filter(descendant__in=chunk) \
+                    .values_list('descendant', 'ancestor'):
+                linked[descendant].append(ancestor)
+
+        unlinked = [period_id for period_id, ancestors in linked.items()
+                    if not ancestors]
+        for chunk in chunked(unlinked, 500):
+            linked.update(cls.link(Period.objects.in_bulk(chunk).values()))
+        for period_id, ancestors in linked.items():
+            if not ancestors:
+                # custom and semester periods have no calendar ancestors
+                linked[period_id] = [period_id]
+        return linked
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.db import models
+from django.db.models.signals import (post_init, post_save, pre_delete,
+                                      m2m_changed)
+from django.dispatch import receiver
+
+from py3compat import implements_to_string
+
+from kurantooro.models.Models import Report
+
+
+@implements_to_string
+class ProblemCount(models.Model):
+    ''' Number of reports of a Problem per Period, Category and KuranUser.
+
+    Maintained by the signals below and rebuilt by `rebuild_rollups`.
+    A report counts for its period and every coarser calendar period
+    including it (day > week > month > quarter > year). '''
+
+    class Meta:
+        app_label = 'kurantooro'
+        # kuran_user is nullable and NULLs never collide: use user_key
+        unique_together = ('period', 'problem', 'category', 'user_key')
+        index_together = [('period', 'category')]
+
+    period = models.ForeignKey('Period', related_name='problem_counts')
+    problem = models.ForeignKey('Problem', related_name='counts',
+                                verbose_name="Problème")
+    category = models.ForeignKey('Category', related_name='problem_counts',
+                                 verbose_name="Catégorie")
+    kuran_user = models.ForeignKey('KuranUser', null=True, blank=True,
+                                   related_name='problem_counts')
+    # kuran_user_id, or ANONYMOUS for reports without user
+    user_key = models.IntegerField(default=0, editable=False)
+    count = models.PositiveIntegerField(default=0, verbose_name="Nombre")
+
+    ANONYMOUS = 0
+
+    @classmethod
+    def user_key_for(cls, user_id):
+        return cls.ANONYMOUS if user_id is None else user_id
+
+    def save(self, *args, **kwargs):
+        self.user_key = self.user_key_for(self.kuran_user_id)
+        super(ProblemCount, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return "{problem}/{period}: {count}".format(problem=self.problem_id,
+                                                    period=self.period,
+                                                    count=self.count)
+
+
+def report_key(report):
+    return (report.period_id, report.kuran_user_id)
+
+
+@receiver(post_init, sender=Report)
+def remember_report_key(sender, instance, **kwargs):
+    instance._rollup_key = report_key(instance)
+
+
+@receiver(post_save, sender=Report)
+def move_report_counts(sender, instance, created, **kwargs):
+    from kurantooro import rollups
+    old_key, new_key = instance._rollup_key, report_key(instance)
+    instance._rollup_key = new_key
+    if created or old_key == new_key:
+        return
+    problems = list(instance.problems.all())
+    counts = rollups.report_counts(old_key, problems, -1)
+    counts.update(rollups.report_counts(new_key, problems, 1))
+    rollups.apply(counts)
+
+
+@receiver(pre_delete, sender=Report)
+def remove_report_counts(sender, instance, **kwargs):
+    from kurantooro import rollups
+    rollups.apply(rollups.report_counts(report_key(instance),
+                                        instance.problems.all(), -1))
+
+
+@receiver(m2m_changed, sender=Report.problems.through)
+def update_report_counts(sender, instance, action, reverse, model, pk_set,
+                         **kwargs):
+    from kurantooro import rollups
+    if action == 'pre_clear':
+        # pk_set is not provided on clear: remember what goes away
+        if reverse:
+            instance._rollup_cleared = list(instance.problemes.all())
+        else:
+            instance._rollup_cleared = list(instance.problems.all())
+        return
+    if action == 'post_clear':
+        objects = instance._rollup_cleared
+        sign = -1
+    elif action in ('post_add', 'post_remove'):
+        objects = model.objects.filter(pk__in=pk_set)
+        sign = 1 if action == 'post_add' else -1
+    else:
+        return
+
+    if reverse:
+        # instance is a Problem, objects are Reports
+        counts = rollups.Counter()
+        for report in objects:
+            counts.update(rollups.report_counts(report_key(report),
+                                                [instance], sign))
+    else:
+        counts = rollups.report_counts(report_key(instance), objects, sign)
+    rollups.apply(counts)
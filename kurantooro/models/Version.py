@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+
+from django.db import models, IntegrityError
+from django.db.models import F
+
+from py3compat import implements_to_string
+
+from kurantooro.utils import atomic
+
+
+@implements_to_string
+class DataVersion(models.Model):
+    ''' Counter bumped whenever a set of derived data changes.
+
+    Kept in the database so that every process sees the same versions
+    (the default cache is process-local) and bumped in the transaction
+    of the change itself. '''
+
+    class Meta:
+        app_label = 'kurantooro'
+
+    ROLLUPS = 'rollups'
+    TAXONOMY = 'taxonomy'
+
+    name = models.CharField(max_length=30, primary_key=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "{name}: {value}".format(name=self.name, value=self.value)
+
+    @classmethod
+    def get(cls, name):
+        try:
+            return cls.objects.values_list('value', flat=True).get(name=name)
+        except cls.DoesNotExist:
+            return 0
+
+    @classmethod
+    def bump(cls, name):
+        rows = cls.objects.filter(name=name)
+        if rows.update(value=F('value') + 1):
+            return
+        try:
+            with atomic():
+                cls.objects.create(name=name, value=1)
+        except IntegrityError:
+            # created concurrently
+            rows.update(value=F('value') + 1)
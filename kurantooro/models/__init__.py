@@ -4,3 +4,8 @@
 
 from kurantooro.models.Period import Period, MonthPeriod, YearPeriod, WeekPeriod, QuarterPeriod, DayPeriod
 from kurantooro.models.Models import Report, Category, Problem, KuranUser
+from kurantooro.models.Rollup import ProblemCount
+from kurantooro.models.Change import Change
+from kurantooro.models.PeriodHierarchy import PeriodHierarchy
+from kurantooro.models.Archive import ReportArchive
+from kurantooro.models.Version import DataVersion
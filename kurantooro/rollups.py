@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Maintenance of the ProblemCount rollup table.
+
+Counts are handled as Counters keyed by
+(period_id, problem_id, category_id, kuran_user_id) at the level of the
+report's own period ; expand() adds the coarser calendar periods. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+from collections import Counter, defaultdict
+
+from django.db import connections, router
+
+from kurantooro import dashboard
+from kurantooro.models.Models import Report
+from kurantooro.models.PeriodHierarchy import PeriodHierarchy
+from kurantooro.models.Rollup import ProblemCount
+from kurantooro.utils import atomic, bulk_insert_ignore, chunked
+
+# keys of a grouped UPDATE are bound as 4 parameters each (SQLite: 999)
+UPDATE_BATCH_SIZE = (999 - 1) // 4
+
+
+def report_counts(key, problems, sign=1):
+    ''' Counter for one report with key (period_id, kuran_user_id) '''
+    period_id, user_id = key
+    return Counter(dict(((period_id, problem.pk, problem.category_id,
+                          user_id), sign) for problem in problems))
+
+
+def count_reports(reports):
+    ''' Counter for a queryset of reports, computed in a single query '''
+    rows = Report.problems.through.objects \
+                 .filter(report__in=reports) \
+                 .values_list('report__period', 'problem',
+                              'problem__category', 'report__kuran_user')
+    return Counter(rows.iterator())
+
+
+def rollup_periods(period_ids):
+    ''' {period_id: [period_id and ids of coarser periods including it]} '''
+    return PeriodHierarchy.ancestor_ids(period_ids)
+
+
+def expand(counts):
+    ''' counts with each entry repeated for the coarser periods '''
+    levels = rollup_periods(set(key[0] for key in counts))
+    expanded = Counter()
+    for key, count in counts.items():
+        period_id, problem_id, category_id, user_id = key
+        for level_id in levels.get(period_id, [period_id]):
+            expanded[(level_id, problem_id, category_id, user_id)] += count
+    return expanded
+
+
+def apply(counts):
+    ''' adds counts to the existing ProblemCount rows '''
+    expanded = expand(counts)
+    write_increments(expanded)
+    dashboard.invalidate()
+
+
+def write_increments(expanded):
+    with atomic():
+        increment(expanded)
+
+
+def increment(expanded):
+    ''' adds expanded to ProblemCount: the missing rows are inserted with
+        a zero count, then one UPDATE per increment value (and batch) '''
+    bulk_insert_ignore(
+        ProblemCount, ('period', 'problem', 'category', 'kuran_user',
+                       'user_key', 'count'),
+        [(period_id, problem_id, category_id, user_id,
+          ProblemCount.user_key_for(user_id), 0)
+         for (period_id, problem_id, category_id, user_id), count
+         in expanded.items() if count > 0])
+    keys_by_count = defaultdict(list)
+    for key, count in expanded.items():
+        if count:
+            keys_by_count[count].append(key)
+    for count, keys in keys_by_count.items():
+        for batch in chunked(keys, UPDATE_BATCH_SIZE):
+            add_to_rows(count, batch)
+
+
+def add_to_rows(count, keys):
+    ''' one UPDATE adding count to the ProblemCount rows of keys ; raw
+        SQL: the ORM spends longer building the OR than SQL running it '''
+    connection = connections[router.db_for_write(ProblemCount)]
+    qn = connection.ops.quote_name
+    columns = [qn(ProblemCount._meta.get_field(name).column)
+               for name in ('period', 'problem', 'category', 'user_key')]
+    match = "({})".format(" AND ".join("{} = %s".format(column)
+                                       for column in columns))
+    params = [count]
+    for period_id, problem_id, category_id, user_id in keys:
+        params.extend((period_id, problem_id, category_id,
+                       ProblemCount.user_key_for(user_id)))
+    connection.cursor().execute(
+        "UPDATE {table} SET {count} = {count} + %s WHERE {keys}".format(
+            table=qn(ProblemCount._meta.db_table), count=qn('count'),
+            keys=" OR ".join([match] * len(keys))), params)
+
+
+def replace(counts):
+    ''' replaces the whole ProblemCount table with counts '''
+    with atomic():
+        ProblemCount.objects.all().delete()
+        ProblemCount.objects.bulk_create(
+            [ProblemCount(period_id=period_id, problem_id=problem_id,
+                          category_id=category_id, kuran_user_id=user_id,
+                          user_key=ProblemCount.user_key_for(user_id),
+                          count=count)
+             for (period_id, problem_id, category_id, user_id), count
+             in expand(counts).items() if count > 0],
+            batch_size=500)
+    dashboard.invalidate()
+
+
+def rebuild():
+    ''' recomputes ProblemCount from all reports, archived ones included '''
+    from kurantooro import archive
+    counts = count_reports(Report.objects.all())
+    counts.update(archive.count_archived())
+    replace(counts)
+    return ProblemCount.objects.count()
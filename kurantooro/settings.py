@@ -101,6 +101,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'kurantooro.middleware.QueryInstrumentationMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -134,6 +135,44 @@ INSTALLED_APPS = (
 
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 
+# Number of resolved Period instances kept in each process' LRU cache.
+PERIOD_CACHE_SIZE = 4096
+
+# Number of rendered period names kept in each process' LRU cache.
+PERIOD_LABEL_CACHE_SIZE = 4096
+
+# archive_reports moves to per-year tables the reports of the years
+# ending more than ARCHIVE_AFTER_YEARS years before the current one.
+ARCHIVE_AFTER_YEARS = 2
+
+# Directory of the columnar Report x Problem snapshot (snapshot_reports).
+ANALYTICS_SNAPSHOT_DIR = os.path.join(ROOT_DIR, 'snapshot')
+
+# snapshot_reports leaves out the reports changed within the last
+# ANALYTICS_SNAPSHOT_LAG seconds (uncommitted lower ids, problems not
+# linked yet) ; the next run picks them up.
+ANALYTICS_SNAPSHOT_LAG = 60
+
+# (years before, years after) the current one whose periods are
+# materialized and cached at WSGI startup. None disables the warm-up.
+PERIOD_CACHE_WARMUP = (1, 1)
+
+# /api/sync only serves changes older than SYNC_LAG seconds so that
+# rows committed out of sequence order are not skipped. Keep it above
+# the longest write transaction (one ingestion chunk).
+SYNC_LAG = 60
+
+# Cache alias sharing the Category/Problem taxonomy snapshots between
+# processes. None loads them in each process (the version is always
+# shared, through the database).
+TAXONOMY_CACHE = None
+
+# Per-request query count, SQL/view/template time as X-* headers and
+# JSON lines on the kurantooro.requests logger. Requests slower than
+# SLOW_REQUEST_THRESHOLD milliseconds are logged with their SQL.
+QUERY_INSTRUMENTATION = DEBUG
+SLOW_REQUEST_THRESHOLD = 500
+
 # A sample logging configuration. The only tangible logging
 # performed by this configuration is to send an email to
 # the site admins on every HTTP 500 error when DEBUG=False.
@@ -152,6 +191,10 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler'
         }
     },
     'loggers': {
@@ -160,6 +203,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'kurantooro.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Process-local cache of the Category/Problem taxonomy.
+
+    taxonomy = get_taxonomy()
+    taxonomy.problem('paludisme').category.name
+
+Snapshots are keyed by the taxonomy DataVersion, bumped in the database
+on every save or delete of a Category or Problem so that every process
+sees the change (one primary key lookup per get_taxonomy()). With
+settings.TAXONOMY_CACHE naming a cache alias (memcached, database...),
+the snapshots themselves are shared between processes too. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from kurantooro.models.Models import Category, Problem
+from kurantooro.models.Version import DataVersion
+
+TIMEOUT = 60 * 60 * 24 * 30
+
+_lock = threading.Lock()
+_local = {'taxonomy': None}
+
+
+class Taxonomy(object):
+    ''' Immutable snapshot of categories and problems, ordered by name '''
+
+    def __init__(self, version, categories, problems):
+        self.version = version
+        self.categories = OrderedDict((category.slug, category)
+                                      for category in categories)
+        self.problems = OrderedDict()
+        self.by_category = dict((slug, []) for slug in self.categories)
+        for problem in problems:
+            # set the ForeignKey cache: problem.category costs no query
+            problem.category = self.categories[problem.category_id]
+            self.problems[problem.slug] = problem
+            self.by_category[problem.category_id].append(problem)
+        self.category_names = dict((category.name, category)
+                                   for category in categories)
+        self.problem_names = dict((problem.name, problem)
+                                  for problem in problems)
+
+    def category(self, slug):
+        return self.categories.get(slug)
+
+    def problem(self, slug):
+        return self.problems.get(slug)
+
+    def problems_for(self, category_slug):
+        return self.by_category.get(category_slug, [])
+
+    def category_by_name(self, name):
+        return self.category_names.get(name)
+
+    def problem_by_name(self, name):
+        return self.problem_names.get(name)
+
+
+def shared_cache():
+    alias = getattr(settings, 'TAXONOMY_CACHE', None)
+    return get_cache(alias) if alias else None
+
+
+def current_version():
+    return DataVersion.get(DataVersion.TAXONOMY)
+
+
+def bump():
+    ''' invalidates every snapshot ; called on Category/Problem changes '''
+    DataVersion.bump(DataVersion.TAXONOMY)
+    with _lock:
+        _local['taxonomy'] = None
+
+
+def load(version):
+    return Taxonomy(version, list(Category.objects.all()),
+                    list(Problem.objects.all()))
+
+
+def get_taxonomy():
+    ''' Taxonomy snapshot of the current version '''
+    version = current_version()
+    taxonomy = _local['taxonomy']
+    if taxonomy is not None and taxonomy.version == version:
+        return taxonomy
+
+    with _lock:
+        cache = shared_cache()
+        key = 'taxonomy:{}'.format(version)
+        taxonomy = cache.get(key) if cache is not None else None
+        if taxonomy is None:
+            taxonomy = load(version)
+            if cache is not None:
+                cache.set(key, taxonomy, TIMEOUT)
+        _local['taxonomy'] = taxonomy
+    return taxonomy
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import json
+import shutil
+import tempfile
+from datetime import date, datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from kurantooro import (analytics, archive, calendar_engine, rollups,
+                        taxonomy)
+from kurantooro.api import encode_cursor
+from kurantooro.exports import Echo, export
+from kurantooro.ingest import ingest
+from kurantooro.models.Archive import ReportArchive
+from kurantooro.models.Change import Change
+from kurantooro.models.Models import Report, Category, Problem, KuranUser
+from kurantooro.models.Rollup import ProblemCount
+from kurantooro.models.Version import DataVersion
+from kurantooro.utils import UnicodeWriter, unicode_dict_reader
+from kurantooro.models.Period import (Period, DayPeriod, WeekPeriod,
+                                      MonthPeriod, QuarterPeriod, YearPeriod,
+                                      period_cache, label_cache)
+
+
+class ClearCachesMixin(object):
+    ''' clears the per-process period and taxonomy caches before each
+        test: they may hold rows a previous test rolled back '''
+
+    def _pre_setup(self):
+        super(ClearCachesMixin, self)._pre_setup()
+        period_cache.clear()
+        label_cache.clear()
+        taxonomy.bump()
+
+
+class KuranTestCase(ClearCachesMixin, TestCase):
+    pass
+
+
+class ArchiveTestCase(ClearCachesMixin, TransactionTestCase):
+    ''' archive tables are created with DDL, which commits on SQLite:
+        the tables are dropped and the database flushed instead of
+        rolling back '''
+
+    def tearDown(self):
+        for report_archive in ReportArchive.objects.all():
+            archive.drop_tables(report_archive)
+
+
+class PeriodRenderingTest(KuranTestCase):
+
+    def setUp(self):
+        day = date(2013, 10, 12)
+        Period.find_create_specs(
+            calendar_engine.spec_for(period_type, day)
+            for period_type in calendar_engine.CALENDAR_TYPES)
+        # rendering must not be served from the caches
+        period_cache.clear()
+        label_cache.clear()
+
+    def test_periods_are_cast_to_their_proxy(self):
+        classes = dict((period.period_type, period.__class__)
+                       for period in Period.objects.all())
+        self.assertEqual(classes, {Period.DAY: DayPeriod,
+                                   Period.WEEK: WeekPeriod,
+                                   Period.MONTH: MonthPeriod,
+                                   Period.QUARTER: QuarterPeriod,
+                                   Period.YEAR: YearPeriod})
+
+    def test_rendering_n_periods_costs_one_query(self):
+        with self.assertNumQueries(1):
+            for period in Period.objects.all():
+                period.name()
+                period.full_name()
+                period.pid
+                period.strid()
+                "{}".format(period)
+
+    def test_pid_and_equality(self):
+        periods = list(Period.objects.all())
+        for period in periods:
+            self.assertEqual(period.pid, period.key)
+            same = Period.objects.get(pk=period.pk)
+            self.assertEqual(period, same)
+            self.assertEqual(hash(period), hash(same))
+        self.assertEqual(len(set(period.pid for period in periods)),
+                         len(periods))
+        self.assertNotEqual(periods[0], "not a period")
+
+
+class WeekNumberTest(KuranTestCase):
+
+    def test_week_number_is_the_calendar_week(self):
+        week = WeekPeriod.find_create_from(2013, week=5)
+        self.assertEqual(week.start_on.date(), date(2013, 2, 4))
+        same = WeekPeriod.find_create_by_date(datetime(2013, 2, 10,
+                                                       23, 59, 55))
+        self.assertEqual(same.pk, week.pk)
+        self.assertEqual(Period.objects.filter(
+            period_type=Period.WEEK, start_on__lte=same.end_on,
+            end_on__gte=week.start_on).count(), 1)
+
+    def test_iso_week_one_includes_january_4th(self):
+        week = WeekPeriod.find_create_by_weeknum(2015, 1, is_iso=True)
+        self.assertEqual(week.start_on.date(), date(2014, 12, 29))
+
+class IngestTest(KuranTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(slug='sante', name="Santé")
+        Problem.objects.create(slug='paludisme', name="Paludisme",
+                               category=category)
+
+    def test_invalid_types_are_item_errors(self):
+        records = [{'created_on': 20131012, 'problems': ['paludisme']},
+                   {'created_on': '2013-10-12', 'username': ['a'],
+                    'problems': ['paludisme']},
+                   {'created_on': '2013-10-12', 'problems': [{'a': 1}]},
+                   {'created_on': '2013-10-12', 'problems': ['paludisme']}]
+        result = ingest(records)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([number for number, error in result.errors],
+                         [1, 2, 3])
+
+    def test_ids_are_assigned_by_the_database(self):
+        ingest([{'created_on': '2013-10-12', 'problems': ['paludisme']}])
+        report = Report.objects.get()
+        self.assertEqual([problem.slug for problem in report.problems.all()],
+                         ['paludisme'])
+        Report.objects.create(period=report.period)
+        self.assertEqual(Report.objects.count(), 2)
+
+    def test_rollups_match_a_rebuild(self):
+        ingest([{'created_on': '2013-10-12', 'problems': ['paludisme']}])
+        ingest([{'created_on': '2013-10-1{}'.format(day),
+                 'problems': ['paludisme']} for day in (2, 3, 3)])
+
+        def counts():
+            return sorted(ProblemCount.objects.values_list(
+                'period', 'problem', 'user_key', 'count'))
+        incremental = counts()
+        self.assertEqual(max(row[-1] for row in incremental), 4)
+        rollups.rebuild()
+        self.assertEqual(incremental, counts())
+
+
+class UnicodeCSVTest(KuranTestCase):
+
+    def test_accented_values_round_trip(self):
+        writer = UnicodeWriter(Echo())
+        lines = [writer.writerow(["name", "category"]),
+                 writer.writerow(["Fièvre", "Santé"])]
+        self.assertEqual(list(unicode_dict_reader(lines)),
+                         [{"name": "Fièvre", "category": "Santé"}])
+
+
+class CursorTest(KuranTestCase):
+
+    def setUp(self):
+        User.objects.create_user('reader', password='reader')
+        self.client.login(username='reader', password='reader')
+
+    def test_malformed_cursors_are_bad_requests(self):
+        cursors = [[], {'a': 1}, [1, "x"], ["2013-10-12T00:00:00", "1"],
+                   [True, 1], "abc"]
+        # a single string is the cursor of the slug ordered endpoints
+        pairs = cursors + [["2013-10-12T00:00:00"]]
+        slugs = cursors + [[1], [None]]
+        for url, invalid in (('/api/reports/', pairs),
+                             ('/api/periods/', pairs),
+                             ('/api/problems/', slugs),
+                             ('/api/categories/', slugs)):
+            for cursor in invalid:
+                response = self.client.get(url,
+                                           {'cursor': encode_cursor(cursor)})
+                self.assertEqual(response.status_code, 400, (url, cursor))
+
+
+class ReportsConditionalTest(KuranTestCase):
+
+    def setUp(self):
+        User.objects.create_user('reader', password='reader')
+        self.client.login(username='reader', password='reader')
+
+    def test_only_the_etag_validates(self):
+        response = self.client.get('/api/reports/')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(
+            '/api/reports/',
+            HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+
+class ChangeJournalTest(KuranTestCase):
+
+    def journal(self):
+        return list(Change.objects.filter(model=Change.REPORT, object_id='1')
+                                  .order_by('id')
+                                  .values_list('action', 'owner'))
+
+    def test_moved_report_leaves_a_tombstone_for_its_former_owner(self):
+        Change.record(Change.REPORT, 1, Change.UPSERT, 7)
+        Change.record(Change.REPORT, 1, Change.UPSERT, 8)
+        self.assertEqual(self.journal(), [(Change.DELETE, 7),
+                                          (Change.UPSERT, 8)])
+        Change.record(Change.REPORT, 1, Change.UPSERT, 8)
+        self.assertEqual(self.journal(), [(Change.DELETE, 7),
+                                          (Change.UPSERT, 8)])
+        Change.record(Change.REPORT, 1, Change.UPSERT, 7)
+        self.assertEqual(self.journal(), [(Change.DELETE, 8),
+                                          (Change.UPSERT, 7)])
+
+
+class SyncTest(KuranTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(slug='sante', name="Santé")
+        Problem.objects.create(slug='paludisme', name="Paludisme",
+                               category=category)
+        # the KuranUser sharing the auth id of the logged in user is not
+        # the logged in user
+        KuranUser.objects.create(username='other')
+        KuranUser.objects.create(username='reader')
+        User.objects.create_user('reader', password='reader')
+        self.client.login(username='reader', password='reader')
+
+    def test_own_reports_are_matched_by_username(self):
+        self.assertNotEqual(User.objects.get(username='reader').pk,
+                            KuranUser.objects.get(username='reader').pk)
+        ingest([{'created_on': '2013-10-12', 'username': username,
+                 'problems': ['paludisme']}
+                for username in ('other', 'reader', 'other')])
+        with self.settings(SYNC_LAG=0):
+            response = self.client.get('/api/sync/', {'since': 0})
+        reports = [change['data']['username'] for change
+                   in json.loads(response.content)['changes']
+                   if change['model'] == Change.REPORT]
+        self.assertEqual(reports, ['reader'])
+
+
+class DashboardConditionalTest(KuranTestCase):
+
+    def setUp(self):
+        User.objects.create_user('reader', password='reader')
+        self.client.login(username='reader', password='reader')
+
+    def get(self, **headers):
+        ''' (response, SQL of the queries it ran) '''
+        connection.use_debug_cursor = True
+        try:
+            response = self.client.get('/', **headers)
+            # connection.queries is reset when each request starts
+            return response, [query['sql'] for query in connection.queries]
+        finally:
+            connection.use_debug_cursor = False
+
+    def test_repeated_requests_skip_rendering_and_aggregates(self):
+        response, queries = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response, queries = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.templates)
+        table = ProblemCount._meta.db_table
+        self.assertFalse([sql for sql in queries if table in sql])
+
+    def test_rollups_changes_invalidate_the_etag(self):
+        etag = self.get()[0]['ETag']
+        DataVersion.bump(DataVersion.ROLLUPS)
+        response, queries = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ArchiveReadTest(ArchiveTestCase):
+
+    def setUp(self):
+        category = Category.objects.create(slug='sante', name="Santé")
+        Problem.objects.create(slug='paludisme', name="Paludisme",
+                               category=category)
+        ingest([{'created_on': '2011-05-02', 'problems': ['paludisme']},
+                {'created_on': '2013-10-12', 'problems': ['paludisme']}])
+        list(archive.archive_year(2011))
+
+    def test_exports_include_archived_reports(self):
+        self.assertEqual(Report.objects.count(), 1)
+        rows = [json.loads(line) for line in export('jsonl')]
+        self.assertEqual([row['created_on'][:10] for row in rows],
+                         ['2013-10-12', '2011-05-02'])
+        self.assertEqual([row['problems'] for row in rows],
+                         [['paludisme'], ['paludisme']])
+
+    def test_archived_reports_read_their_archived_problems(self):
+        year = Period.objects.get(pk=archive.get_archive(2011).period_id)
+        reports = list(archive.reports_in(year))
+        self.assertEqual([[problem.slug for problem in report.problems.all()]
+                          for report in reports], [['paludisme']])
+        self.assertEqual(archive.count_in(year), 1)
+
+
+class SnapshotTest(ArchiveReadTest):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        super(SnapshotTest, self).tearDown()
+
+    def test_recently_changed_reports_wait_for_the_lag(self):
+        self.assertEqual(sum(analytics.refresh(self.path, lag=60)), 0)
+        self.assertEqual(sum(analytics.refresh(self.path, lag=0)), 2)
+
+    def test_rebuild_includes_archived_reports(self):
+        list(analytics.refresh(self.path, rebuild=True, lag=0))
+        snapshot = analytics.Snapshot.open(self.path)
+        self.assertEqual(len(snapshot), 2)
+        self.assertEqual(snapshot.count_by('problem'), {('paludisme', ): 2})
+
+    def test_archived_reports_keep_their_dates(self):
+        facts, last_id = analytics.report_facts(0, 10)
+        self.assertEqual(sorted(fact[-1] for fact in facts),
+                         [datetime(2011, 5, 2), datetime(2013, 10, 12)])
+        list(analytics.refresh(self.path, rebuild=True, lag=0))
+        days = analytics.Snapshot.open(self.path).column('day')
+        self.assertEqual(sorted(days.tolist()),
+                         [calendar_engine.epoch_seconds(datetime(*day))
+                          // 86400 for day in ((2011, 5, 2), (2013, 10, 12))])
@@ -14,6 +14,18 @@ admin.autodiscover()
 urlpatterns = patterns('',
     # Examples:
     url(r'^$', 'kurantooro.views.dashboard', name='dashboard'),
+    url(r'^reports/ingest/$', 'kurantooro.views.ingest_reports',
+        name='ingest_reports'),
+    url(r'^reports/export/$', 'kurantooro.views.export_reports',
+        name='export_reports'),
+    url(r'^api/reports/$', 'kurantooro.api.reports', name='api_reports'),
+    url(r'^api/periods/$', 'kurantooro.api.periods', name='api_periods'),
+    url(r'^api/problems/$', 'kurantooro.api.problems', name='api_problems'),
+    url(r'^api/categories/$', 'kurantooro.api.categories',
+        name='api_categories'),
+    url(r'^api/sync/$', 'kurantooro.api.sync', name='api_sync'),
+    url(r'^api/autocomplete/problems/$', 'kurantooro.api.autocomplete',
+        name='api_autocomplete'),
     # url(r'^kurantooro/', include('kurantooro.foo.urls')),
 
     # Uncomment the next line to enable the admin:
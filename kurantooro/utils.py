@@ -5,7 +5,13 @@
 from __future__ import (unicode_literals, absolute_import,
                         division, print_function)
 
-from django.utils import timezone
+import csv
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, router, transaction, IntegrityError
+from django.utils import six, timezone
 
 
 def normalize_date(target, as_aware=True):
@@ -20,9 +26,140 @@ def normalize_date(target, as_aware=True):
         return timezone.make_naive(target, timezone.utc)
 
 
+@contextmanager
+def atomic(using=None):
+    """ commit_on_success, or a savepoint when a transaction is already
+        managed so that the caller's transaction is never committed """
+    if not transaction.is_managed(using=using):
+        with transaction.commit_on_success(using=using):
+            yield
+        return
+    sid = transaction.savepoint(using=using)
+    try:
+        yield
+    except Exception:
+        transaction.savepoint_rollback(sid, using=using)
+        raise
+    transaction.savepoint_commit(sid, using=using)
+
+
 def next_month(year, month):
     """ next year and month as int from year and month """
     if month < 12:
         return (year, month + 1)
     else:
         return (year + 1, 1)
+
+
+def chunked(iterable, size):
+    """ lists of at most size items from iterable """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def db_datetime(value):
+    """ value with aware datetimes made naive (UTC) when USE_TZ is off:
+        the backends refuse aware datetimes then """
+    if isinstance(value, datetime) and not settings.USE_TZ \
+            and timezone.is_aware(value):
+        return normalize_date(value, as_aware=False)
+    return value
+
+
+def bulk_insert_ignore(model, field_names, rows):
+    """ INSERT rows (tuples ordered as field_names) skipping the ones
+        conflicting with a unique constraint. Safe under concurrency. """
+    rows = list(rows)
+    if not rows:
+        return
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+
+    if connection.vendor == 'sqlite':
+        sql_format = ("INSERT OR IGNORE INTO {table} ({columns}) "
+                      "VALUES {values}")
+    elif connection.vendor == 'mysql':
+        sql_format = "INSERT IGNORE INTO {table} ({columns}) VALUES {values}"
+    elif connection.vendor == 'postgresql':
+        sql_format = ("INSERT INTO {table} ({columns}) VALUES {values} "
+                      "ON CONFLICT DO NOTHING")
+    else:
+        # no native syntax: one savepoint-protected INSERT per row
+        for row in rows:
+            sid = transaction.savepoint(using=using)
+            try:
+                model.objects.using(using).create(**dict(
+                    (field.attname, value) for field, value in zip(fields,
+                                                                   row)))
+            except IntegrityError:
+                transaction.savepoint_rollback(sid, using=using)
+            else:
+                transaction.savepoint_commit(sid, using=using)
+        return
+
+    # stay under SQLite's 999 parameters limit
+    batch_size = max(1, 999 // len(fields))
+    placeholder = "({})".format(", ".join(["%s"] * len(fields)))
+    cursor = connection.cursor()
+    for offset in range(0, len(rows), batch_size):
+        batch = rows[offset:offset + batch_size]
+        params = []
+        for row in batch:
+            params.extend(field.get_db_prep_save(db_datetime(value),
+                                                 connection=connection)
+                          for field, value in zip(fields, row))
+        cursor.execute(sql_format.format(
+            table=qn(model._meta.db_table),
+            columns=", ".join(qn(field.column) for field in fields),
+            values=", ".join([placeholder] * len(batch))), params)
+    transaction.commit_unless_managed(using=using)
+
+
+def to_csv_cell(value):
+    """ value as the Python 2 csv module handles it: UTF-8 bytes """
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def from_csv_cell(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, list):
+        return [from_csv_cell(item) for item in value]
+    return value
+
+
+class UnicodeWriter(object):
+    """ csv.writer taking rows of text on Python 2 and 3 ; writerow()
+        returns what the file-like object's write() returns, as text """
+
+    def __init__(self, f, **kwargs):
+        self.writer = csv.writer(f, **kwargs)
+
+    def writerow(self, row):
+        if six.PY3:
+            return self.writer.writerow(row)
+        return from_csv_cell(self.writer.writerow(
+            [to_csv_cell(value) for value in row]))
+
+
+def unicode_dict_reader(lines, **kwargs):
+    """ csv.DictReader of text lines yielding text values on Python 2
+        and 3 (the Python 2 csv module only reads bytes) """
+    if six.PY3:
+        for row in csv.DictReader(lines, **kwargs):
+            yield row
+        return
+    for row in csv.DictReader((to_csv_cell(line) for line in lines),
+                              **kwargs):
+        yield dict((from_csv_cell(key), from_csv_cell(value))
+                   for key, value in row.items())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: ai ts=4 sts=4 et sw=4 nu
+
+''' Data version markers for conditional GET (ETag / Last-Modified).
+
+    @conditional(last_change, current_month)
+    def view(request): ...
+
+answers 304 Not Modified, without running the view, when the markers
+are the ones the client already has. Markers are computed at most once
+per request. '''
+
+from __future__ import (unicode_literals, absolute_import,
+                        division, print_function)
+import hashlib
+
+from django.db.models import Max
+from django.views.decorators.http import condition
+
+from kurantooro.models.Change import Change
+from kurantooro.models.Models import Report
+from kurantooro.models.Period import Period, MonthPeriod, WeekPeriod
+from kurantooro.models.Version import DataVersion
+from kurantooro.taxonomy import current_version
+
+
+def marker(name):
+    ''' decorator memoizing a marker function on the request '''
+    def decorator(compute):
+        def wrapper(request):
+            markers = request.__dict__.setdefault('_version_markers', {})
+            if name not in markers:
+                markers[name] = compute(request)
+            return markers[name]
+        wrapper.__name__ = compute.__name__
+        return wrapper
+    return decorator
+
+
+@marker('latest_report')
+def latest_report(request):
+    ''' created_on of the most recent report '''
+    return Report.objects.aggregate(latest=Max('created_on'))['latest']
+
+
+@marker('last_change')
+def last_change(request):
+    ''' sequence of the last change to reports, problems or categories '''
+    return Change.objects.aggregate(last=Max('id'))['last']
+
+
+@marker('taxonomy')
+def taxonomy_version(request):
+    ''' DataVersion of the Category/Problem taxonomy '''
+    return current_version()
+
+
+@marker('last_period')
+def last_period(request):
+    return Period.objects.aggregate(last=Max('id'))['last']
+
+
+@marker('current_month')
+def current_month(request):
+    return MonthPeriod.current().pk
+
+
+@marker('current_week')
+def current_week(request):
+    return WeekPeriod.current().pk
+
+
+@marker('rollups')
+def rollups_version(request):
+    ''' DataVersion of the ProblemCount rollups, bumped on every change
+        including rebuild_rollups and backfill_rollups '''
+    return DataVersion.get(DataVersion.ROLLUPS)
+
+
+def user(request):
+    return request.user.pk
+
+
+def make_etag(parts):
+    return hashlib.md5(":".join("{}".format(part) for part in parts)
+                       .encode('utf-8')).hexdigest()
+
+
+def conditional(*markers, **kwargs):
+    ''' condition() with an ETag made of markers and, unless
+        last_modified=None, Last-Modified from the latest report '''
+    last_modified = kwargs.get('last_modified', latest_report)
+
+    def etag_func(request, *args, **kwargs):
+        return make_etag([request.get_full_path()] +
+                         [get(request) for get in markers])
+
+    def last_modified_func(request, *args, **kwargs):
+        return last_modified(request)
+
+    return condition(etag_func=etag_func,
+                     last_modified_func=last_modified_func
+                     if last_modified else None)
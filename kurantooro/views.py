@@ -5,13 +5,65 @@
 from __future__ import (unicode_literals, absolute_import,
                         division, print_function)
 
+import json
+
+from django.http import (HttpResponse, HttpResponseForbidden,
+                         StreamingHttpResponse, Http404)
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+
+from kurantooro.dashboard import get_context as dashboard_context
+from kurantooro.exports import export
+from kurantooro.ingest import ingest, parse
+from kurantooro.models.Period import Period
+from kurantooro.versions import (conditional, user, current_week,
+                                 current_month, rollups_version)
 
 
 @login_required()
+@conditional(user, current_week, current_month, rollups_version,
+             last_modified=None)
 def dashboard(request):
+    ''' figures only change with the rollups and the current week/month:
+        no Last-Modified, which would ignore rollups rebuilds '''
 
     context = {'page': 'dashboard'}
+    context.update(dashboard_context())
 
     return render(request, "dashboard.html", context)
+
+
+@require_POST
+def ingest_reports(request):
+    ''' bulk creation of reports sent as JSON lines or CSV (?format=csv).
+        Session authenticated: clients send the CSRF token (X-CSRFToken) '''
+    if not request.user.is_authenticated():
+        return HttpResponseForbidden()
+
+    if request.GET.get('format') == 'csv' \
+            or 'csv' in request.META.get('CONTENT_TYPE', ''):
+        format = 'csv'
+    else:
+        format = 'jsonl'
+    lines = request.body.decode('utf-8').splitlines()
+    result = ingest(parse(lines, format))
+    return HttpResponse(json.dumps(result.as_dict()),
+                        content_type='application/json')
+
+
+@login_required()
+def export_reports(request):
+    ''' streamed CSV (default) or JSON lines (?format=jsonl) of reports,
+        optionally filtered by ?period=<id> and ?category=<slug> '''
+    format = 'jsonl' if request.GET.get('format') == 'jsonl' else 'csv'
+    try:
+        lines = export(format, period_id=request.GET.get('period'),
+                       category=request.GET.get('category'))
+    except (Period.DoesNotExist, ValueError):
+        raise Http404
+    content_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = \
+        'attachment; filename="reports.{}"'.format(format)
+    return response
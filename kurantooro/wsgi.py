@@ -27,6 +27,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kurantooro.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Creates and caches the periods of the surrounding years so that
+# lookups of live reports are served without writing.
+from kurantooro.models.Period import Period
+Period.warm_cache()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)